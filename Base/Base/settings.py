@@ -42,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'recportal.metrics.MetricsMiddleware',
+    'recportal.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'recportal.auth.SeniorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +58,8 @@ ROOT_URLCONF = 'Base.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the django backend, instrumented to time template rendering (see recportal/metrics.py)
+        'BACKEND': 'recportal.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,15 +81,117 @@ WSGI_APPLICATION = 'Base.wsgi.application'
 
 DATABASES = {
     'default':{
-        'ENGINE': 'django.db.backends.mysql',
+        # mysqlclient with a pool of connections per worker process, see
+        # recportal/backends/mysql/base.py
+        'ENGINE': 'recportal.backends.mysql',
         'NAME': 'recportal',
         'USER': env.DBUSER,
         'PASSWORD': env.DBPASSWORD,
         'HOST': 'localhost',
         'PORT': '3306',
+        'POOL': {
+            # at most as many connections as the worker has threads are used at once
+            'SIZE': 10,
+            # below MySQL's wait_timeout (8 hours by default)
+            'IDLE_TIMEOUT': 60 * 5,
+            'WAIT_TIMEOUT': 10,
+        },
     }
 }
 
+# Aliases of read replicas of 'default' (added to DATABASES like it), which take
+# the reads of GET requests, see recportal/routers.py. With none, everything
+# goes to 'default'. To try it locally with two SQLite databases:
+#
+#   DATABASES = {
+#       'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'primary.sqlite3'},
+#       'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica.sqlite3', 'TEST': {'MIRROR': 'default'}},
+#   }
+#   DATABASE_REPLICAS = ['replica']
+#
+# and copy primary.sqlite3 over replica.sqlite3 after migrating, and whenever
+# the replica should catch up.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['recportal.routers.ReplicaRouter']
+
+# seconds for which reads of a user go to 'default' after they changed something,
+# longer than the replication lag
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+# The cached counts and pages are invalidated by signals (see recportal/signals.py),
+# which only works if every worker process reads the same cache, hence memcached
+# (python-memcached) rather than the per-process local memory cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'recportal',
+    },
+    # Sessions must be in a cache every worker process shares too: with one per
+    # process, signing out (or a password change flushing the session) would only
+    # drop the session from the cache of the worker handling it, and the others
+    # would keep serving it. A separate key prefix keeps them apart from the cached
+    # pages; a session memcached evicts is read back from the database.
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'recportal-sessions',
+    },
+}
+
+# Sessions are read from the cache and only fall back to the database on a miss
+# (e.g. after an eviction or a memcached restart). They are written through to
+# both, and only when they change.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# SeniorBackend loads the user of a session together with their Senior profile.
+# ModelBackend stays for the sessions signed in before it was added.
+AUTHENTICATION_BACKENDS = [
+    'recportal.auth.SeniorBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# seconds for which the recommendations badge count may be served from the cache,
+# it is dropped as soon as a recommendation of the senior changes
+RECOMMENDATIONS_COUNT_TIMEOUT = 60 * 60
+
+# seconds for which the assessments and tasks of a candidate profile are cached
+PROFILE_CACHE_TIMEOUT = 60 * 15
+
+# seconds for which pages of "My Candidates" are cached, 0 turns the cache off
+MYCANDIDATES_CACHE_TIMEOUT = 60 * 15
+
+# seconds after which the funnel dashboard on the home page is recomputed
+DASHBOARD_CACHE_TIMEOUT = 60 * 5
+
+# Each signed in tab asks for its live notifications every EVENTS_POLL_SECONDS,
+# see recportal/events.py. Events are sent once EVENTS_COMMIT_LAG_SECONDS old
+# (longer than the transactions writing them) and kept for EVENTS_KEEP_SECONDS,
+# after which the pruneevents command deletes them.
+EVENTS_POLL_SECONDS = 15
+EVENTS_COMMIT_LAG_SECONDS = 5
+EVENTS_KEEP_SECONDS = 60 * 10
+
+# The "since" of the API (see recportal/api.py) is moved back by this many
+# seconds, longer than any transaction, so that a row saved before but committed
+# after a newer one is not missed. Rows changed in that window are sent again.
+API_SINCE_SAFETY_SECONDS = 60
+# the oldest "since" the API accepts, clients further behind list everything
+# again. The prunedeletions command deletes the Deletions older than that.
+API_SINCE_MAX_AGE = 60 * 60 * 24 * 30
+
+# number of rows per page on the paginated listings
+PAGE_SIZE = 50
+
+
+# the benchmarks in recportal/tests.py are left out unless run with --tag=benchmark
+TEST_RUNNER = 'recportal.testrunner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -129,3 +235,27 @@ LOGIN_URL = 'recportal:signin'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'rubrics')
+
+# collectstatic writes content hashed, precompressed copies of the static files
+# and the image variants below, see recportal/staticfiles.py
+STATICFILES_STORAGE = 'recportal.staticfiles.CompressedManifestStaticFilesStorage'
+
+# the widths (in pixels) of the resized copies made of these images, along with
+# a WebP copy of each. Images are never scaled up.
+STATIC_IMAGE_VARIANTS = {
+    'recportal/Background.jpg': [480, 768],
+}
+
+# Rubric downloads are streamed by the workers unless this is set to
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect' (nginx),
+# in which case the front web server sends the file. For nginx, an internal
+# location serving MEDIA_ROOT must be mounted at RUBRIC_ACCEL_PREFIX.
+RUBRIC_SENDFILE = None
+RUBRIC_ACCEL_PREFIX = '/protected-rubrics/'
+
+# Chunked rubric uploads are staged here until they are complete. It must be on
+# the same filesystem as MEDIA_ROOT so finished files can be moved into place.
+RUBRIC_UPLOAD_ROOT = os.path.join(BASE_DIR, 'uploads')
+RUBRIC_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# seconds after which the gcrubrics command deletes an upload that received nothing
+RUBRIC_UPLOAD_EXPIRY = 60 * 60 * 24 * 2
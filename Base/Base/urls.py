@@ -18,10 +18,12 @@ from django.conf import settings
 from django.conf.urls import url, include
 from django.conf.urls.static import static
 
+from recportal import views
+
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^{}(?P<path>.+)$'.format(settings.STATIC_URL.lstrip('/')), views.Static, name='static'),
     url(r'^', include('recportal.urls')),
 ]
 
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
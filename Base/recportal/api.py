@@ -0,0 +1,189 @@
+''' The read-only JSON API (version 1) over candidates, assessments (with their
+    task) and recommendations, see the Api view.
+
+    Every response carries an ETag and a Last-Modified header derived from the
+    newest updated_at (and deletion) of the rows asked for and their number, so
+    that polling clients revalidating with If-None-Match or If-Modified-Since get
+    a 304 for the cost of one aggregate query. Passing the "until" of a response
+    as "since" to the next request returns only the rows changed since, plus the
+    ids of the ones deleted since. Rows changed up to API_SINCE_SAFETY_SECONDS
+    before "since" are returned again (their transaction may have committed after
+    the previous response), so clients should update the rows they have by id.
+    A "since" older than API_SINCE_MAX_AGE is refused, as the Deletions are only
+    kept for that long, and the client has to list everything again. '''
+import hashlib
+import calendar
+import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recportal.models import Candidate, Assessment, Recommendation, Deletion
+from recportal.pagination import keysetPaginate
+
+MAX_LIMIT = 500
+
+
+class ApiError(Exception):
+    ''' an invalid request, the message is meant for the client '''
+    pass
+
+
+def assessmentTask(assessment):
+    task = assessment.task
+    if task is None:
+        return None
+    return {
+        'id': task.pk,
+        'title': task.title,
+        'description': task.description,
+        'issuing_date': task.issuing_date,
+        'due_date': task.due_date,
+        'completion_date': task.completion_date,
+        'status': assessment.task_status,
+        'days_late': assessment.days_late,
+        'rubric': task.rubric_filename if task.rubric else None,
+    }
+
+
+# name: (queryset, model name of the Deletions, {field: function giving its value})
+# id and updated_at are always included
+RESOURCES = {
+    'candidates': (
+        lambda: Candidate.objects.all(),
+        'candidate',
+        {
+            'first_name': lambda candidate: candidate.first_name,
+            'last_name': lambda candidate: candidate.last_name,
+            'ph': lambda candidate: candidate.ph,
+            'email': lambda candidate: candidate.email,
+            'skill1': lambda candidate: candidate.skill1,
+            'skill2': lambda candidate: candidate.skill2,
+            'about': lambda candidate: candidate.about,
+            'pitched': lambda candidate: candidate.pitched,
+        },
+    ),
+    'assessments': (
+        lambda: Assessment.objects.withRelations().withTaskStatus(),
+        'assessment',
+        {
+            'candidate': lambda assessment: assessment.candidate_id,
+            'candidate_name': lambda assessment: assessment.candidate.get_full_name(),
+            'senior': lambda assessment: assessment.senior_id,
+            'senior_name': lambda assessment: assessment.senior.get_full_name(),
+            'team': lambda assessment: assessment.team,
+            'pitched': lambda assessment: assessment.pitched,
+            'task': assessmentTask,
+        },
+    ),
+    'recommendations': (
+        lambda: Recommendation.objects.select_related('candidate', 'recommending_senior', 'recommended_senior'),
+        'recommendation',
+        {
+            'candidate': lambda recommendation: recommendation.candidate_id,
+            'candidate_name': lambda recommendation: recommendation.candidate.get_full_name(),
+            'recommending_senior': lambda recommendation: recommendation.recommending_senior_id,
+            'recommended_senior': lambda recommendation: recommendation.recommended_senior_id,
+            'status': lambda recommendation: recommendation.status,
+            'reason': lambda recommendation: recommendation.reason,
+        },
+    ),
+}
+
+
+def selectFields(resource, value):
+    ''' the fields asked for by the comma separated value, all of them if empty '''
+    available = RESOURCES[resource][2]
+    if not value:
+        return list(available)
+    fields = [field.strip() for field in value.split(',') if field.strip() not in ('', 'id', 'updated_at')]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError('Unknown fields: {}.'.format(', '.join(unknown)))
+    return fields
+
+
+def parseSince(value):
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value.replace(' ', '+'))     # a + in a query string is a space
+    except ValueError:      # well formed, but not a valid time (e.g. month 13)
+        since = None
+    if since is None:
+        raise ApiError('since must be an ISO 8601 timestamp.')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.utc)
+    if since < timezone.now() - datetime.timedelta(seconds=settings.API_SINCE_MAX_AGE):
+        raise ApiError('since is too old, list everything again without it.')
+    return since
+
+
+def parseLimit(value):
+    if not value:
+        return settings.PAGE_SIZE
+    if not value.isdigit() or not 0 < int(value) <= MAX_LIMIT:
+        raise ApiError('limit must be between 1 and {}.'.format(MAX_LIMIT))
+    return int(value)
+
+
+class Page:
+    ''' one page of a resource, as asked for by the GET parameters
+
+            fields  comma separated fields to include (all by default)
+            since   only the rows changed after this timestamp, oldest change first
+            after   the cursor of the page ("next" of the previous page)
+            limit   the number of rows per page (PAGE_SIZE by default)
+
+        The version (etag and last_modified) is computed first, and the rows only
+        if the client does not have them already. '''
+
+    def __init__(self, resource, params):
+        self.resource = resource
+        queryset, self.model, _ = RESOURCES[resource]
+        self.fields = selectFields(resource, params.get('fields', ''))
+        self.since = parseSince(params.get('since', ''))
+        self.limit = parseLimit(params.get('limit', ''))
+        self.cursor = params.get('after')
+
+        self.queryset = queryset()
+        self.deletions = Deletion.objects.filter(model=self.model)
+        if self.since:
+            since = self.since - datetime.timedelta(seconds=settings.API_SINCE_SAFETY_SECONDS)
+            self.queryset = self.queryset.filter(updated_at__gt=since)
+            self.deletions = self.deletions.filter(deleted_at__gt=since)
+            self.ordering = ['updated_at', 'pk']
+        else:
+            self.ordering = ['pk']
+
+        version = self.queryset.aggregate(updated=Max('updated_at'), count=Count('pk'))
+        self.count = version['count']
+        # deletions change a full listing as well
+        deleted = self.deletions.aggregate(deleted=Max('deleted_at'))['deleted']
+        self.until = max([stamp for stamp in (version['updated'], deleted, self.since) if stamp], default=None)
+
+    @property
+    def last_modified(self):
+        return calendar.timegm(self.until.utctimetuple()) if self.until else None
+
+    @property
+    def etag(self):
+        key = [self.resource, ','.join(self.fields), self.since, self.cursor, self.limit, self.until, self.count]
+        return hashlib.md5(repr(key).encode()).hexdigest()
+
+    def payload(self):
+        toValue = RESOURCES[self.resource][2]
+        rows, next_cursor = keysetPaginate(self.queryset, self.ordering, self.cursor, self.limit)
+        results = []
+        for obj in rows:
+            # isoformat keeps the microseconds, which JSON encoding would cut to milliseconds
+            row = {'id': obj.pk, 'updated_at': obj.updated_at.isoformat()}
+            for field in self.fields:
+                row[field] = toValue[field](obj)
+            results.append(row)
+        payload = {'results': results, 'next': next_cursor, 'until': self.until.isoformat() if self.until else None}
+        if self.since and not self.cursor:
+            payload['deleted'] = list(self.deletions.values_list('object_id', flat=True).distinct())
+        return payload
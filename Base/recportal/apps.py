@@ -5,6 +5,26 @@ class RecportalConfig(AppConfig):
 
     def ready(self):
         from django.contrib.auth.models import User
-        from django.db.models.signals import post_save
-        from recportal.signals import autoAddSeniorProfile
+        from django.db.models.signals import post_init, post_save, post_delete
+        from recportal.models import Candidate, Assessment, Task, Recommendation
+        from recportal.signals import autoAddSeniorProfile, invalidateRecommendationCaches, invalidateCandidateProfile
+        from recportal.signals import invalidateSeniorProfiles, invalidateCandidateHolders
+        from recportal.signals import rememberRubric, countRubricReferences, releaseRubric, indexCandidate
+        from recportal.signals import touchAssessment, recordDeletion, publishRecommendation, publishTask
         post_save.connect(autoAddSeniorProfile, sender=User)
+        post_save.connect(invalidateSeniorProfiles, sender=User)
+        post_save.connect(invalidateRecommendationCaches, sender=Recommendation)
+        post_delete.connect(invalidateRecommendationCaches, sender=Recommendation)
+        for model in (Candidate, Assessment, Task, Recommendation):
+            post_save.connect(invalidateCandidateProfile, sender=model)
+            post_delete.connect(invalidateCandidateProfile, sender=model)
+        post_init.connect(rememberRubric, sender=Task)
+        post_save.connect(countRubricReferences, sender=Task)
+        post_delete.connect(releaseRubric, sender=Task)
+        post_save.connect(indexCandidate, sender=Candidate)
+        post_save.connect(invalidateCandidateHolders, sender=Candidate)
+        post_save.connect(touchAssessment, sender=Task)
+        for model in (Candidate, Assessment, Recommendation):
+            post_delete.connect(recordDeletion, sender=model)
+        post_save.connect(publishRecommendation, sender=Recommendation)
+        post_save.connect(publishTask, sender=Task)
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import SimpleLazyObject
+
+
+class SeniorBackend(ModelBackend):
+    ''' The model backend, except that the user of a session is loaded together
+        with their Senior profile in one joined query, so that request.user.senior
+        (rendered on every page by base.html) costs nothing more. '''
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('senior').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def getSenior(request):
+    if not request.user.is_authenticated:
+        return None
+    try:
+        return request.user.senior
+    except ObjectDoesNotExist:     # the RelatedObjectDoesNotExist of a user without one
+        return None
+
+
+class SeniorMiddleware:
+    ''' Sets request.senior, the Senior profile of the signed in user (None for
+        anonymous users and users without one), loaded at most once per request
+        and only if used. Has to come after the AuthenticationMiddleware. '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.senior = SimpleLazyObject(lambda: getSenior(request))
+        return self.get_response(request)
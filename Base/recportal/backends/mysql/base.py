@@ -0,0 +1,57 @@
+''' The mysqlclient backend with pooled connections, used with
+
+        'ENGINE': 'recportal.backends.mysql',
+        'POOL': {'SIZE': 10, 'IDLE_TIMEOUT': 300, 'WAIT_TIMEOUT': 10},
+
+    in DATABASES (the POOL settings are optional, see ConnectionPool for what
+    they mean). Django still "closes" the connection at the end of every request
+    (leave CONN_MAX_AGE at 0), which hands it back to the pool of the worker
+    process instead, so requests no longer pay for connecting and authenticating.
+    The pool counters are exposed by the Metrics view. '''
+from django.db.backends.mysql.base import Database, DatabaseWrapper as MySQLDatabaseWrapper
+
+from recportal.pool import PoolTimeout, getPool
+
+
+def isUsable(connection):
+    try:
+        connection.ping()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL', {})
+        # the test runner points an alias to another database, which must not
+        # be served connections to the old one
+        key = (self.alias, self.settings_dict['HOST'], self.settings_dict['PORT'], self.settings_dict['NAME'], self.settings_dict['USER'])
+        return getPool(
+            key,
+            size=options.get('SIZE', 10),
+            idle_timeout=options.get('IDLE_TIMEOUT', 300),
+            wait_timeout=options.get('WAIT_TIMEOUT', 10),
+        )
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params), isUsable)
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e))
+
+    def _close(self):
+        if self.in_atomic_block:
+            # Django keeps using the connection object until the end of the
+            # block, so it must not be handed to anyone else
+            self.pool.discard(self.connection)
+            return
+        try:
+            # nothing of this request may leak into the next user of the connection
+            self.connection.rollback()
+        except Database.Error:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.release(self.connection)
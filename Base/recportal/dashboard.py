@@ -0,0 +1,105 @@
+''' The recruitment funnel shown on the home page.
+
+    The numbers are computed with four aggregate queries (candidates, assessments,
+    and assessments grouped by team and by senior) into a rollup that is cached for
+    DASHBOARD_CACHE_TIMEOUT seconds. When the rollup gets stale, one request
+    recomputes it while the others keep being served the stale one, so a crowd
+    of seniors opening the home page at once does not run the queries for each
+    of them. '''
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Case, When, Q, IntegerField
+
+from recportal.models import Candidate, Assessment, TaskQuerySet
+
+CACHE_KEY = 'recportal:funnel'
+LOCK_KEY = 'recportal:funnel:lock'
+# how long a request may take to recompute the rollup before another one tries
+LOCK_TIMEOUT = 60
+
+
+def countIf(condition):
+    ''' COUNT of the rows matching condition '''
+    return Count(Case(When(condition, then=1), output_field=IntegerField()))
+
+
+def assessmentCounts():
+    ''' the counts shown for every team and every senior '''
+    return {
+        'assessments': Count('pk'),
+        'pitched': countIf(Q(pitched=True)),
+        'ongoing': countIf(TaskQuerySet.statusCondition('ongoing', 'task__')),
+        'overdue': countIf(TaskQuerySet.statusCondition('overdue', 'task__')),
+    }
+
+
+def pitchRate(row):
+    return round(100.0 * row['pitched'] / row['assessments']) if row['assessments'] else 0
+
+
+def computeFunnel():
+    ''' Returns the rollup as a dictionary of
+            stages:     (name, number of candidates) pairs, from registration to pitch
+            totals:     the assessmentCounts of all assessments, with their pitch_rate
+            statuses:   the number of tasks per status (see TaskQuerySet.STATUSES)
+            teams:      the assessmentCounts per team, with their pitch_rate
+            seniors:    the assessmentCounts per senior, the busiest first
+            computed:   when the rollup was computed (a timestamp) '''
+    candidates = Candidate.objects.aggregate(registered=Count('pk'), pitched=countIf(Q(pitched=True)))
+
+    # a candidate is counted once per stage however many seniors assess them
+    def candidatesIf(condition):
+        return Count(Case(When(condition, then='candidate_id'), output_field=IntegerField()), distinct=True)
+
+    aggregates = assessmentCounts()
+    aggregates.update((status, countIf(TaskQuerySet.statusCondition(status, 'task__'))) for status in TaskQuerySet.STATUSES)
+    totals = Assessment.objects.aggregate(
+        candidates_assessed=Count('candidate_id', distinct=True),
+        candidates_tasked=candidatesIf(Q(task__isnull=False)),
+        candidates_completed=candidatesIf(Q(task__completion_date__isnull=False)),
+        candidates_pitched=candidatesIf(Q(pitched=True)),
+        **aggregates
+    )
+    totals['pitch_rate'] = pitchRate(totals)
+
+    teams = list(Assessment.objects.order_by().values('team').annotate(**assessmentCounts()).order_by('team'))
+    seniors = list(Assessment.objects.order_by().values('senior_id', 'senior__first_name', 'senior__last_name')
+                   .annotate(**assessmentCounts()).order_by('-assessments', 'senior__first_name', 'senior__last_name'))
+    for row in teams + seniors:
+        row['pitch_rate'] = pitchRate(row)
+
+    return {
+        'stages': [
+            ('Registered', candidates['registered']),
+            ('Assessed', totals['candidates_assessed']),
+            ('Task Assigned', totals['candidates_tasked']),
+            ('Task Completed', totals['candidates_completed']),
+            ('Pitched by a Senior', totals['candidates_pitched']),
+            ('Pitched', candidates['pitched']),
+        ],
+        'totals': totals,
+        'statuses': [(status, totals[status]) for status in TaskQuerySet.STATUSES],
+        'teams': teams,
+        'seniors': seniors,
+        'computed': time.time(),
+    }
+
+
+def getFunnel():
+    ''' the cached rollup, recomputed by one request at a time once it is stale '''
+    funnel = cache.get(CACHE_KEY)
+    if funnel is not None and time.time() - funnel['computed'] < settings.DASHBOARD_CACHE_TIMEOUT:
+        return funnel
+    if funnel is None:
+        funnel = computeFunnel()
+        cache.set(CACHE_KEY, funnel, None)
+    # cache.add only succeeds for one of the requests racing here
+    elif cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        try:
+            funnel = computeFunnel()
+            cache.set(CACHE_KEY, funnel, None)
+        finally:
+            cache.delete(LOCK_KEY)
+    return funnel
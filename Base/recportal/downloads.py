@@ -0,0 +1,131 @@
+import os
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from django.utils.timezone import utc
+
+from recportal.mimeTypes import MIME_TYPES
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# control characters (CR and LF would end the header), quotes and backslashes
+UNSAFE_NAME_RE = re.compile(r'[\x00-\x1f\x7f"\\]')
+
+
+def rubricPath(filename):
+    ''' the absolute path of a rubric inside MEDIA_ROOT. Anything resolving outside
+        of MEDIA_ROOT (e.g. through "..") or missing on disk is a 404. '''
+    root = os.path.abspath(settings.MEDIA_ROOT)
+    path = os.path.abspath(os.path.join(root, filename))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        raise Http404('No such rubric.')
+    return path
+
+
+def rubricMimeType(filename):
+    ''' look the extension up in MIME_TYPES, defaulting to text '''
+    return MIME_TYPES.get(filename.split(".")[-1].lower(), "text/plain")
+
+
+def rubricETag(request, filename):
+    ''' a cheap validator built from the modification time and size of the file,
+        so no part of the file has to be read to answer a conditional request '''
+    try:
+        stat = os.stat(rubricPath(filename))
+    except Http404:
+        return None
+    return '{:x}-{:x}'.format(int(stat.st_mtime), stat.st_size)
+
+
+def rubricLastModified(request, filename):
+    try:
+        mtime = os.path.getmtime(rubricPath(filename))
+    except Http404:
+        return None
+    return datetime.fromtimestamp(int(mtime), utc)
+
+
+def parseRange(header, size):
+    ''' parse a single "bytes=start-end" Range header into (start, end) inclusive.
+        Returns None when the whole file should be sent (no header, multiple
+        ranges or a malformed header) and raises ValueError when the range
+        cannot be satisfied. '''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:                       # suffix range, i.e. the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Unsatisfiable range.')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Unsatisfiable range.')
+    return start, min(end, size - 1)
+
+
+def readChunks(path, start, length):
+    ''' yield length bytes of the file starting at start, CHUNK_SIZE at a time '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serveRubric(request, filename):
+    ''' Build the response for a rubric download.
+
+        If settings.RUBRIC_SENDFILE is 'x-sendfile' or 'x-accel-redirect', the
+        transfer (including range requests) is handed off to the front web
+        server and no file data passes through the worker. Otherwise the file
+        is streamed from disk in CHUNK_SIZE pieces, honouring a single byte
+        range. '''
+    path = rubricPath(filename)
+    size = os.path.getsize(path)
+    mimetype = rubricMimeType(filename)
+    mode = getattr(settings, 'RUBRIC_SENDFILE', None)
+
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=mimetype)
+        response['X-Sendfile'] = path
+    elif mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=mimetype)
+        response['X-Accel-Redirect'] = settings.RUBRIC_ACCEL_PREFIX + os.path.relpath(path, os.path.abspath(settings.MEDIA_ROOT))
+    else:
+        byte_range = None
+        # an If-Range that does not match means the client's partial copy is stale
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range == quote_etag(rubricETag(request, filename)):
+            try:
+                byte_range = parseRange(request.META.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(size)
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(readChunks(path, start, end - start + 1), status=206, content_type=mimetype)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = StreamingHttpResponse(readChunks(path, 0, size), content_type=mimetype)
+            response['Content-Length'] = str(size)
+        response['Accept-Ranges'] = 'bytes'
+
+    # rubrics are stored under their hash, the original name is passed along in the url
+    # and is only trusted once stripped of the characters that could break out of the header
+    name = UNSAFE_NAME_RE.sub('', os.path.basename(request.GET.get('name') or '')) or os.path.basename(filename)
+    response['Content-Disposition'] = 'inline; filename="{}"'.format(name)
+    return response
@@ -0,0 +1,84 @@
+''' Live notifications for the signed in seniors, as server-sent events.
+
+    The Recommendation and Task signals (and the views saving them in bulk) publish
+    events as Event rows, in the transaction of the change, so any process can
+    read them. The Events view answers with the events of the user since the
+    Last-Event-ID their browser sends and ends the response right away. The
+    "retry" it starts with makes the browser ask again EVENTS_POLL_SECONDS later,
+    so an open tab costs one short request every EVENTS_POLL_SECONDS rather than
+    a worker held for as long as it is open. The browser updates the
+    recommendations badge and inbox without reloading (see base.html).
+
+    Event ids are the time (in microseconds since the epoch) up to which events
+    have been sent. An event is only sent once it is EVENTS_COMMIT_LAG_SECONDS
+    old, so that one written by a transaction that commits after a newer one is
+    not skipped. '''
+import json
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from recportal.models import Event
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+# how far ahead of the clock a Last-Event-ID may be, anything further (which may
+# not even be a valid time) is taken as no Last-Event-ID
+MAX_CLOCK_SKEW = datetime.timedelta(days=1)
+
+
+def publish(user_ids, kind, data):
+    ''' publish an event to the users, part of the current transaction (if any)
+        so that it is only seen along with the changes it is about '''
+    Event.objects.bulk_create([Event(user_id=user_id, kind=kind, data=json.dumps(data)) for user_id in set(user_ids)])
+
+
+def notifyRecommendations(user_ids, candidate=None, senior=None):
+    ''' the pending recommendations of the users changed, a new one for candidate
+        by senior if given '''
+    data = {}
+    if candidate is not None:
+        data['candidate'] = candidate.get_full_name()
+    if senior is not None:
+        data['senior'] = senior.get_full_name()
+    publish(user_ids, 'recommendations', data)
+
+
+def eventId(moment):
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def eventTime(event_id):
+    return EPOCH + datetime.timedelta(microseconds=event_id)
+
+
+def formatEvent(event_id, kind, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, kind, json.dumps(data))
+
+
+def pendingEvents(senior, last_event_id):
+    ''' The text/event-stream of the events for senior since last_event_id,
+        starting with the current number of pending recommendations. A browser
+        connecting for the first time, or after more than EVENTS_KEEP_SECONDS
+        (e.g. a laptop waking up), only gets the count. '''
+    now = timezone.now()
+    if last_event_id is not None and last_event_id > eventId(now + MAX_CLOCK_SKEW):
+        last_event_id = None
+    until = now - datetime.timedelta(seconds=settings.EVENTS_COMMIT_LAG_SECONDS)
+    since = eventTime(last_event_id) if last_event_id is not None else None
+    if since is not None and since > until:
+        until = since       # sent before a clock change
+    event_id = eventId(until)
+
+    count = senior.active_recommendations_count
+    stream = ['retry: {}\n\n'.format(settings.EVENTS_POLL_SECONDS * 1000), formatEvent(event_id, 'recommendations', {'count': count})]
+    if since is None or since < until - datetime.timedelta(seconds=settings.EVENTS_KEEP_SECONDS):
+        return ''.join(stream)
+    events = Event.objects.filter(user_id=senior.user_id, created__gt=since, created__lte=until).order_by('created', 'pk')
+    for kind, data in events.values_list('kind', 'data'):
+        data = json.loads(data)
+        if kind == 'recommendations':
+            data['count'] = count
+        stream.append(formatEvent(event_id, kind, data))
+    return ''.join(stream)
@@ -0,0 +1,102 @@
+import csv
+import tempfile
+
+from django.db import router
+
+from recportal.models import Candidate, Assessment, Recommendation
+from recportal.pagination import keysetPaginate
+
+CHUNK_SIZE = 2000
+
+
+def candidateRow(candidate):
+    return [candidate.first_name, candidate.last_name, candidate.ph, candidate.email, candidate.skill1,
+            candidate.skill2, candidate.about, candidate.pitched]
+
+
+def assessmentRow(assessment):
+    task = assessment.task
+    row = [assessment.candidate.get_full_name(), assessment.senior.get_full_name(), assessment.team, assessment.pitched]
+    if task:
+        row += [task.title, task.description, task.issuing_date, task.due_date, task.completion_date,
+                assessment.task_status == 'overdue', task.rubric_filename if task.rubric else '']
+    return row
+
+
+def recommendationRow(recommendation):
+    return [recommendation.candidate.get_full_name(), recommendation.recommending_senior.get_full_name(),
+            recommendation.recommended_senior.get_full_name(), recommendation.status, recommendation.reason]
+
+
+# name: (queryset, header row, function turning an object into a row)
+TABLES = {
+    'candidates': (
+        lambda: Candidate.objects.all(),
+        ['First Name', 'Last Name', 'Phone Number', 'Email ID', 'Skill 1', 'Skill 2', 'About', 'Pitched'],
+        candidateRow,
+    ),
+    'assessments': (
+        lambda: Assessment.objects.withRelations().withTaskStatus(),
+        ['Candidate', 'Senior', 'Potential Team', 'Pitched', 'Task Title', 'Task Description', 'Issuing Date',
+         'Due Date', 'Date of Completion', 'Overdue', 'Rubric'],
+        assessmentRow,
+    ),
+    'recommendations': (
+        lambda: Recommendation.objects.select_related('candidate', 'recommending_senior', 'recommended_senior'),
+        ['Candidate', 'Recommending Senior', 'Recommended Senior', 'Accepted', 'Reason'],
+        recommendationRow,
+    ),
+}
+
+
+def exportDatabase(table):
+    ''' The database alias to export table from (a read replica for the GET
+        requests that may use one, see recportal/routers.py). It has to be chosen
+        by the view: a streamed export reads its rows after the view, and the
+        routing of the request, have returned. '''
+    return router.db_for_read(TABLES[table][0]().model)
+
+
+def exportRows(table, using):
+    ''' Yield the header and then every row of the table, read from the database
+        using. Rows are fetched CHUNK_SIZE at a time with keyset pagination over
+        the primary key, so neither the database driver nor the worker ever holds
+        the whole table. '''
+    queryset, header, toRow = TABLES[table]
+    yield header
+    cursor = None
+    while True:
+        objects, cursor = keysetPaginate(queryset().using(using), ['pk'], cursor, CHUNK_SIZE)
+        for obj in objects:
+            yield toRow(obj)
+        if cursor is None:
+            break
+
+
+class Echo:
+    ''' a file-like object whose write() just hands the line back, so that a
+        csv.writer can produce lines for a streaming response '''
+    def write(self, value):
+        return value
+
+
+def streamCSV(table):
+    ''' the lines of the csv export of table, read once the response is streamed '''
+    using = exportDatabase(table)
+    writer = csv.writer(Echo())
+    return (writer.writerow(row) for row in exportRows(table, using))
+
+
+def writeXLSX(table):
+    ''' Write the table into a temporary .xlsx file with openpyxl's write-only
+        mode (rows are flushed to disk as they are appended) and return the
+        file, rewound. '''
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=table)
+    for row in exportRows(table, exportDatabase(table)):
+        sheet.append(row)
+    f = tempfile.TemporaryFile()
+    workbook.save(f)
+    f.seek(0)
+    return f
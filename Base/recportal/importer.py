@@ -0,0 +1,135 @@
+import io
+import csv
+
+from django.db import IntegrityError, transaction
+
+from recportal.models import Candidate
+from recportal.search import indexCandidates
+from recportal.validators import isValidPhone, isValidEmail
+
+COLUMNS = ['first_name', 'last_name', 'ph', 'email', 'skill1', 'skill2', 'about']
+REQUIRED_COLUMNS = ['first_name', 'last_name', 'ph', 'email']
+ERROR_COLUMNS = ['row', 'error'] + COLUMNS
+
+
+class SheetError(Exception):
+    ''' raised when a sheet as a whole cannot be imported (unknown format, missing columns) '''
+    pass
+
+
+def cellText(value):
+    ''' spreadsheet cells may hold numbers (phone numbers usually do), normalise to text '''
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def readRows(f, filename):
+    ''' Yield (row number, values) for every non-empty data row of a .csv or .xlsx
+        file, where values is a dict keyed by the (lower-cased) header row.
+
+        Rows are read lazily (openpyxl is used in its read-only mode), so memory
+        use does not depend on the size of the sheet. '''
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        rows = csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''))
+    elif extension == 'xlsx':
+        from openpyxl import load_workbook
+        sheet = load_workbook(f, read_only=True).active
+        rows = ([cell.value for cell in row] for row in sheet.iter_rows())
+    else:
+        raise SheetError('Only .csv and .xlsx files can be imported.')
+
+    try:
+        header = [cellText(column).lower().replace(' ', '_') for column in next(rows)]
+    except StopIteration:
+        raise SheetError('The file is empty.')
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise SheetError('Missing column(s): {}.'.format(', '.join(missing)))
+
+    for number, row in enumerate(rows, start=2):     # row 1 is the header
+        values = dict(zip(header, (cellText(value) for value in row)))
+        if any(values.values()):
+            yield number, values
+
+
+def validateRow(values):
+    ''' Build an unsaved Candidate out of a row, applying the same rules as the
+        candidates form. Returns (candidate, None) or (None, error message). '''
+    first_name = values.get('first_name', '').replace(' ', '_')
+    last_name = values.get('last_name', '').replace(' ', '_')
+    if not first_name or not last_name:
+        return None, 'Essential data missing.'
+    if len(first_name) > 50 or len(last_name) > 50:
+        return None, 'Name too long.'
+    if not isValidPhone(values.get('ph', '')):
+        return None, 'Invalid phone number.'
+    if not isValidEmail(values.get('email', '')):
+        return None, 'Invalid email address.'
+    if len(values.get('skill1', '')) > 100 or len(values.get('skill2', '')) > 100:
+        return None, 'Skill too long.'
+    return Candidate(first_name=first_name, last_name=last_name, ph=values['ph'], email=values['email'],
+                     skill1=values.get('skill1', ''), skill2=values.get('skill2', ''), about=values.get('about', ''), pitched=False), None
+
+
+def importCandidates(rows, errors, batch_size=1000):
+    ''' Insert the candidates of rows (see readRows) with one bulk_create per batch.
+
+        Rejected rows are written to errors, a csv.writer, together with the
+        reason (invalid data or a name that is already taken). Returns a tuple
+        of (imported, rejected) counts. '''
+    errors.writerow(ERROR_COLUMNS)
+    imported = rejected = 0
+    batch = []
+
+    def reject(number, reason, values):
+        errors.writerow([number, reason] + [values.get(column, '') for column in COLUMNS])
+
+    def flush():
+        ''' insert a batch, skipping names that already exist with one query '''
+        nonlocal imported, rejected
+        taken = set(Candidate.objects.filter(first_name__in={c.first_name for _, c, _ in batch}).values_list('first_name', 'last_name'))
+        fresh = []
+        for number, candidate, values in batch:
+            if (candidate.first_name, candidate.last_name) in taken:
+                reject(number, 'A candidate with this name already exists.', values)
+                rejected += 1
+            else:
+                taken.add((candidate.first_name, candidate.last_name))
+                fresh.append((number, candidate, values))
+        try:
+            with transaction.atomic():
+                Candidate.objects.bulk_create([candidate for _, candidate, _ in fresh])
+                # bulk_create sends no signals (and sets no primary keys on MySQL), so
+                # the new candidates are read back in one query to index them for search
+                names = {(candidate.first_name, candidate.last_name) for _, candidate, _ in fresh}
+                indexCandidates(candidate for candidate in Candidate.objects.filter(first_name__in={name[0] for name in names})
+                                if (candidate.first_name, candidate.last_name) in names)
+            imported += len(fresh)
+        except IntegrityError:
+            # somebody else created one of the names in the meantime, fall back to row by row
+            for number, candidate, values in fresh:
+                try:
+                    with transaction.atomic():
+                        candidate.save()
+                    imported += 1
+                except IntegrityError:
+                    reject(number, 'A candidate with this name already exists.', values)
+                    rejected += 1
+        del batch[:]
+
+    for number, values in rows:
+        candidate, error = validateRow(values)
+        if error:
+            reject(number, error, values)
+            rejected += 1
+            continue
+        batch.append((number, candidate, values))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return imported, rejected
@@ -0,0 +1,77 @@
+import os
+import time
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recportal.models import Task, RubricBlob
+from recportal.uploads import expireUploads
+
+
+class Command(BaseCommand):
+    help = 'Delete rubric files that no task references any more, and abandoned uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only list what would be deleted')
+        parser.add_argument('--grace', type=int, default=60 * 60,
+                            help='seconds an unreferenced file is kept for (it may be in the middle of being saved or reused)')
+        parser.add_argument('--upload-expiry', type=int, default=settings.RUBRIC_UPLOAD_EXPIRY,
+                            help='seconds after which an upload that received nothing is deleted')
+
+    def handle(self, *args, **options):
+        storage = Task._meta.get_field('rubric').storage
+        cutoff = time.time() - options['grace']
+        deleted = 0
+
+        # blobs whose reference count dropped to zero at least --grace seconds ago
+        dropped = RubricBlob.objects.filter(references__lte=0, updated_at__lt=timezone.now() - datetime.timedelta(seconds=options['grace']))
+        for name in dropped.values_list('name', flat=True):
+            with transaction.atomic():
+                # the lock makes a task saved meanwhile wait for the count to be settled
+                blob = RubricBlob.objects.select_for_update().filter(name=name, references__lte=0).first()
+                if blob is None:
+                    continue
+                # recount, in case the counter drifted (e.g. a task was changed through update())
+                references = Task.objects.filter(rubric=name).count()
+                if references:
+                    RubricBlob.objects.filter(name=name).update(references=references, updated_at=timezone.now())
+                    continue
+                # the storage touches a file it is about to reuse for a task not saved yet
+                if storage.exists(name) and os.path.getmtime(storage.path(name)) > cutoff:
+                    continue
+                self.stdout.write('unreferenced: {}'.format(name))
+                if not options['dry_run']:
+                    storage.delete(name)
+                    blob.delete()
+                deleted += 1
+
+        # files in the shard directories that were never counted (e.g. a crash between
+        # storing the file and saving the task)
+        counted = set(RubricBlob.objects.values_list('name', flat=True))
+        root = storage.location
+        for directory, _, files in os.walk(root):
+            relative = os.path.relpath(directory, root).replace(os.sep, '/')
+            if relative.count('/') != 1:     # only the ab/cd shard directories
+                continue
+            for filename in files:
+                name = '{}/{}'.format(relative, filename)
+                path = os.path.join(directory, filename)
+                if name in counted or os.path.getmtime(path) > cutoff:
+                    continue
+                if Task.objects.filter(rubric=name).exists():
+                    continue
+                self.stdout.write('uncounted: {}'.format(name))
+                if not options['dry_run']:
+                    os.remove(path)
+                deleted += 1
+
+        self.stdout.write('{} {} rubric file(s).'.format('Would delete' if options['dry_run'] else 'Deleted', deleted))
+
+        # uploads given up on (see recportal/uploads.py)
+        expired = expireUploads(options['upload_expiry'], options['dry_run'])
+        for filename in expired:
+            self.stdout.write('abandoned upload: {}'.format(filename))
+        self.stdout.write('{} {} abandoned upload(s).'.format('Would delete' if options['dry_run'] else 'Deleted', len(expired)))
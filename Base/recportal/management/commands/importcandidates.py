@@ -0,0 +1,27 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recportal.importer import SheetError, readRows, importCandidates
+
+
+class Command(BaseCommand):
+    help = 'Import candidates from a .csv or .xlsx registration sheet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sheet', help='the .csv or .xlsx file to import')
+        parser.add_argument('--errors', help='where to write the report of rejected rows (default: stderr)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of candidates per INSERT')
+
+    def handle(self, *args, **options):
+        report = open(options['errors'], 'w', newline='') if options['errors'] else sys.stderr
+        try:
+            with open(options['sheet'], 'rb') as f:
+                imported, rejected = importCandidates(readRows(f, options['sheet']), csv.writer(report), options['batch_size'])
+        except SheetError as err:
+            raise CommandError(str(err))
+        finally:
+            if options['errors']:
+                report.close()
+        self.stdout.write('Imported {} candidate(s), {} row(s) rejected.'.format(imported, rejected))
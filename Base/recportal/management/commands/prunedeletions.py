@@ -0,0 +1,20 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recportal.api import RESOURCES
+from recportal.models import Deletion
+
+
+class Command(BaseCommand):
+    help = 'Delete the Deletions older than API_SINCE_MAX_AGE, which the API no longer reports.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.API_SINCE_MAX_AGE)
+        deleted = 0
+        # one model at a time, so that the (model, deleted_at) index is used
+        for _, model, _ in RESOURCES.values():
+            deleted += Deletion.objects.filter(model=model, deleted_at__lt=cutoff).delete()[0]
+        self.stdout.write('Deleted {} deletion(s).'.format(deleted))
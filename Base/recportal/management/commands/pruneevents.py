@@ -0,0 +1,16 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recportal.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Delete the live notifications older than EVENTS_KEEP_SECONDS, which are no longer sent.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.EVENTS_KEEP_SECONDS)
+        deleted = Event.objects.filter(created__lt=cutoff).delete()[0]
+        self.stdout.write('Deleted {} event(s).'.format(deleted))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recportal.models import Candidate, SearchPosting
+from recportal.pagination import keysetPaginate
+from recportal.search import indexCandidates
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the candidate search index from scratch.'
+
+    def handle(self, *args, **options):
+        SearchPosting.objects.all().delete()
+        indexed, cursor = 0, None
+        while True:
+            candidates, cursor = keysetPaginate(Candidate.objects.all(), ['pk'], cursor, CHUNK_SIZE)
+            indexCandidates(candidates)
+            indexed += len(candidates)
+            if cursor is None:
+                break
+        self.stdout.write('Indexed {} candidate(s), {} term(s).'.format(indexed, SearchPosting.objects.count()))
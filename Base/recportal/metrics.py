@@ -0,0 +1,234 @@
+''' In-process request metrics for the recportal views.
+
+    MetricsMiddleware records, for every request resolved to a 'recportal:' url
+    name, the request latency, the number of SQL queries and the time spent in
+    them, and the time spent rendering the template. They are aggregated into
+    fixed-bucket histograms and exposed in the Prometheus text format by the
+    Metrics view, together with the number of queries run on each database alias
+    (to see how much of the load the read replicas take, see recportal/routers.py).
+    Streamed responses (e.g. the csv exports) read from the database while they
+    are sent, so theirs are recorded once the whole response has been sent.
+
+    Instrumentation is cheap (a couple of perf_counter() calls per query and per
+    template, and no SQL formatting), so it can stay on in production. Metrics
+    are kept per process: with several WSGI workers each one reports its own
+    numbers, which Prometheus sums up when scraping them. '''
+import threading
+from time import perf_counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import DjangoTemplates
+
+from recportal.pool import pools
+
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+POOL_METRICS = [
+    # (name, type, help)
+    ('hits_total', 'counter', 'Connections handed out from the idle ones.'),
+    ('misses_total', 'counter', 'Connections opened because none was idle.'),
+    ('waits_total', 'counter', 'Requests for a connection that had to wait for one to be released.'),
+    ('timeouts_total', 'counter', 'Requests for a connection that gave up waiting.'),
+    ('discarded_total', 'counter', 'Connections closed because they were dead, broken or idle for too long.'),
+    ('open', 'gauge', 'Connections open, idle or in use.'),
+    ('idle', 'gauge', 'Idle connections.'),
+]
+
+
+class Histogram:
+    ''' a Prometheus style histogram with fixed upper bounds '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    ''' histograms by metric and view name '''
+
+    METRICS = [
+        # (name, help, buckets)
+        ('recportal_request_duration_seconds', 'Time taken by the view, including SQL and templates.', TIME_BUCKETS),
+        ('recportal_sql_queries', 'Number of SQL queries run per request.', COUNT_BUCKETS),
+        ('recportal_sql_duration_seconds', 'Time spent in SQL queries per request.', TIME_BUCKETS),
+        ('recportal_template_duration_seconds', 'Time spent rendering templates per request.', TIME_BUCKETS),
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.queries = {}   # by database alias, of every request and command
+
+    def countQuery(self, alias):
+        with self.lock:
+            self.queries[alias] = self.queries.get(alias, 0) + 1
+
+    def observe(self, view, values):
+        ''' values are in the order of METRICS '''
+        with self.lock:
+            for (name, _, buckets), value in zip(self.METRICS, values):
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(value)
+
+    def exposition(self):
+        ''' the Prometheus text exposition format '''
+        lines = []
+        with self.lock:
+            for name, help_text, buckets in self.METRICS:
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} histogram'.format(name))
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{view="{}",le="{}"}} {}'.format(name, view, bound, cumulative))
+                    lines.append('{}_sum{{view="{}"}} {}'.format(name, view, histogram.sum))
+                    lines.append('{}_count{{view="{}"}} {}'.format(name, view, histogram.count))
+            lines.append('# HELP recportal_sql_queries_total Number of SQL queries run on each database.')
+            lines.append('# TYPE recportal_sql_queries_total counter')
+            for alias, count in sorted(self.queries.items()):
+                lines.append('recportal_sql_queries_total{{alias="{}"}} {}'.format(alias, count))
+        lines += poolExposition()
+        return '\n'.join(lines) + '\n'
+
+
+def poolExposition():
+    ''' the counters and gauges of the connection pools (see recportal/pool.py) '''
+    lines = []
+    stats = [(key[0], pool.stats()) for key, pool in sorted(pools.items())]
+    for name, kind, help_text in POOL_METRICS:
+        if not stats:
+            break
+        lines.append('# HELP recportal_db_pool_{} {}'.format(name, help_text))
+        lines.append('# TYPE recportal_db_pool_{} {}'.format(name, kind))
+        for alias, values in stats:
+            lines.append('recportal_db_pool_{}{{alias="{}"}} {}'.format(name, alias, values[name.replace('_total', '')]))
+    return lines
+
+
+registry = Registry()
+
+# what the current request (i.e. thread) has spent so far
+current = threading.local()
+
+
+def resetCurrent():
+    current.queries = 0
+    current.sql_time = 0
+    current.template_time = 0
+
+
+class TimedCursorWrapper(CursorWrapper):
+
+    def execute(self, sql, params=None):
+        start = perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            recordQuery(self.db.alias, perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        start = perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            recordQuery(self.db.alias, perf_counter() - start)
+
+
+def recordQuery(alias, duration):
+    registry.countQuery(alias)
+    if hasattr(current, 'queries'):
+        current.queries += 1
+        current.sql_time += duration
+
+
+def instrumentConnection(connection, **kwargs):
+    ''' Django 1.11 has no hook around query execution, so the cursors a
+        connection hands out are wrapped in a TimedCursorWrapper '''
+    if getattr(connection, 'recportal_instrumented', False):
+        return
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursorWrapper(make_cursor(cursor), connection)
+    connection.make_debug_cursor = lambda cursor: TimedCursorWrapper(make_debug_cursor(cursor), connection)
+    connection.recportal_instrumented = True
+
+
+class InstrumentedTemplate:
+    ''' wraps a template of the django backend to time its rendering '''
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        start = perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if hasattr(current, 'template_time'):
+                current.template_time += perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    ''' the django template backend, timing every template rendered by a view
+        (includes and extends are part of the time of the including template) '''
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super(InstrumentedDjangoTemplates, self).from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super(InstrumentedDjangoTemplates, self).get_template(template_name))
+
+
+class MetricsMiddleware:
+    ''' records the metrics of every 'recportal:' view, see the module docstring.
+        Should come first in MIDDLEWARE so the latency covers the other middleware. '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(instrumentConnection)
+        for connection in connections.all():
+            instrumentConnection(connection)
+
+    def __call__(self, request):
+        resetCurrent()
+        start = perf_counter()
+        response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match and match.namespace == 'recportal':
+            if response.streaming:
+                # the queries of a streamed response (e.g. a csv export) run as it is sent
+                response.streaming_content = self.observeStream(response.streaming_content, match.url_name, start)
+            else:
+                registry.observe(match.url_name, [perf_counter() - start, current.queries, current.sql_time, current.template_time])
+        return response
+
+    def observeStream(self, content, view, start):
+        try:
+            for chunk in content:
+                yield chunk
+        finally:
+            registry.observe(view, [perf_counter() - start, current.queries, current.sql_time, current.template_time])
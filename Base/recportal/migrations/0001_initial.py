@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Assessment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team', models.CharField(blank=True, default='None', max_length=10)),
+                ('pitched', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Candidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('ph', models.CharField(max_length=12)),
+                ('email', models.EmailField(max_length=254)),
+                ('about', models.TextField(blank=True, default='')),
+                ('skill1', models.CharField(blank=True, default='', max_length=100)),
+                ('skill2', models.CharField(blank=True, default='', max_length=100)),
+                ('pitched', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.BooleanField(default=False)),
+                ('reason', models.TextField(default='Just like that')),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='recportal.Candidate')),
+                ('recommended_senior', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended', to=settings.AUTH_USER_MODEL)),
+                ('recommending_senior', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations_made', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Senior',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team', models.CharField(blank=True, default='None', max_length=10)),
+                ('seniority_level', models.IntegerField(blank=True, default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Senior Extention Data',
+            },
+        ),
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=50)),
+                ('description', models.TextField(max_length=100)),
+                ('issuing_date', models.DateField()),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('completion_date', models.DateField(blank=True, null=True)),
+                ('rubric', models.FileField(blank=True, default=None, upload_to='')),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='recportal.Candidate')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='assessment',
+            name='candidate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assessments', to='recportal.Candidate'),
+        ),
+        migrations.AddField(
+            model_name='assessment',
+            name='senior',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assessments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='assessment',
+            name='task',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='recportal.Task'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def renameDuplicateCandidates(apps, schema_editor):
+    ''' Candidates sharing a name (which no url can tell apart) would fail the
+        unique name key. The first one keeps the name and the others get letters
+        appended to their last name (B, C, ...), compared case insensitively like
+        MySQL does. Assessments and recommendations stay with their candidate. '''
+    import string
+    Candidate = apps.get_model('recportal', 'Candidate')
+    max_length = Candidate._meta.get_field('last_name').max_length
+    names = set((first_name.lower(), last_name.lower()) for first_name, last_name in Candidate.objects.values_list('first_name', 'last_name'))
+    seen = set()
+    for candidate in Candidate.objects.order_by('pk').iterator():
+        key = (candidate.first_name.lower(), candidate.last_name.lower())
+        if key in seen:
+            n = 0
+            while key in names:
+                n += 1
+                suffix, i = '', n
+                while i:
+                    suffix = string.ascii_uppercase[i % 26] + suffix
+                    i //= 26
+                last_name = candidate.last_name[:max_length - len(suffix)] + suffix
+                key = (candidate.first_name.lower(), last_name.lower())
+            Candidate.objects.filter(pk=candidate.pk).update(last_name=last_name)
+            names.add(key)
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recportal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='candidate',
+            options={'ordering': ['first_name', 'last_name']},
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['skill1'], name='candidate_skill1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['skill2'], name='candidate_skill2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['pitched', 'first_name', 'last_name'], name='candidate_pitched_idx'),
+        ),
+        migrations.RunPython(renameDuplicateCandidates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='candidate',
+            unique_together=set([('first_name', 'last_name')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:08
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recportal', '0002_candidate_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RubricUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=100)),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('senior', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='recportal.Task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import recportal.storage
+
+
+def countExistingRubrics(apps, schema_editor):
+    ''' existing rubrics keep their flat names, record their filenames and references '''
+    import os
+    from django.db.models import Count
+    Task = apps.get_model('recportal', 'Task')
+    RubricBlob = apps.get_model('recportal', 'RubricBlob')
+    for task in Task.objects.exclude(rubric='').exclude(rubric__isnull=True):
+        task.rubric_filename = os.path.basename(task.rubric.name)[:100]
+        task.save(update_fields=['rubric_filename'])
+    for row in Task.objects.exclude(rubric='').exclude(rubric__isnull=True).values('rubric').annotate(references=Count('pk')):
+        RubricBlob.objects.create(name=row['rubric'], references=row['references'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recportal', '0003_rubricupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RubricBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='rubric_filename',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='rubric',
+            field=models.FileField(blank=True, default=None, storage=recportal.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.RunPython(countExistingRubrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recportal', '0004_rubricblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.IntegerField(default=1)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='recportal.Candidate')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchposting',
+            unique_together=set([('term', 'candidate')]),
+        ),
+    ]
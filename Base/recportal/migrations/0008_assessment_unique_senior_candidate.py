@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:29
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+def deleteDuplicateAssessments(apps, schema_editor):
+    ''' keep the first assessment of a candidate by a senior, the later ones (double
+        submissions) are deleted along with their tasks '''
+    from django.db.models import Count, F, Min
+    Assessment = apps.get_model('recportal', 'Assessment')
+    Task = apps.get_model('recportal', 'Task')
+    RubricBlob = apps.get_model('recportal', 'RubricBlob')
+    Deletion = apps.get_model('recportal', 'Deletion')
+    duplicates = []
+    for row in Assessment.objects.values('senior', 'candidate').annotate(count=Count('pk'), first=Min('pk')).filter(count__gt=1):
+        duplicates += Assessment.objects.filter(senior=row['senior'], candidate=row['candidate']).exclude(pk=row['first'])
+    if not duplicates:
+        return
+    tasks = Task.objects.filter(pk__in=[assessment.task_id for assessment in duplicates if assessment.task_id])
+    # signals don't run in migrations, do what they would
+    for task in tasks.exclude(rubric='').exclude(rubric__isnull=True):
+        RubricBlob.objects.filter(name=task.rubric.name).update(references=F('references') - 1)
+    Deletion.objects.bulk_create([Deletion(model='assessment', object_id=assessment.pk) for assessment in duplicates])
+    tasks.delete()
+    Assessment.objects.filter(pk__in=[assessment.pk for assessment in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recportal', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(deleteDuplicateAssessments, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='assessment',
+            unique_together=set([('senior', 'candidate')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:39
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+def deleteDuplicateRecommendations(apps, schema_editor):
+    ''' keep one recommendation of a candidate by a senior to another, an accepted
+        one if there is any (it puts the candidate in "My Candidates"), else the first '''
+    from django.db.models import Count
+    Recommendation = apps.get_model('recportal', 'Recommendation')
+    Deletion = apps.get_model('recportal', 'Deletion')
+    duplicates = []
+    keys = ('candidate', 'recommending_senior', 'recommended_senior')
+    for row in Recommendation.objects.values(*keys).annotate(count=Count('pk')).filter(count__gt=1):
+        recommendations = list(Recommendation.objects.filter(**{key: row[key] for key in keys}).order_by('-status', 'pk'))
+        duplicates += recommendations[1:]
+    if not duplicates:
+        return
+    # signals don't run in migrations, do what recordDeletion would
+    Deletion.objects.bulk_create([Deletion(model='recommendation', object_id=recommendation.pk) for recommendation in duplicates])
+    Recommendation.objects.filter(pk__in=[recommendation.pk for recommendation in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recportal', '0008_assessment_unique_senior_candidate'),
+    ]
+
+    operations = [
+        migrations.RunPython(deleteDuplicateRecommendations, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='recommendation',
+            unique_together=set([('candidate', 'recommending_senior', 'recommended_senior')]),
+        ),
+    ]
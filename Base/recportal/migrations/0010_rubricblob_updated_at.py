@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recportal', '0009_recommendation_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rubricblob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,9 +1,18 @@
 import os
+import uuid
+import hashlib
 import datetime
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, F, Func, Value, Case, When, CharField, DateField, IntegerField
+from django.db.models.functions import Substr, Coalesce, Greatest
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from recportal.pagination import keysetPaginate
+from recportal.storage import ContentAddressedStorage
 
 class Senior(models.Model):
     ''' A user extention model for the seniors of the department who would
@@ -33,28 +42,95 @@ class Senior(models.Model):
     def __str__(self):
         return self.user.get_full_name()
 
-    def getActiveRecommendations(self):
-        ''' return a dictionary where keys are candidates and the values are lists
-            of tuples of (recommending seniors, reason for recommendation). The senior parameter is the recommended senior. '''
-        payload = {}
-        for recommendation in self.user.recommended.all():
-            if recommendation.status == False:
-                if recommendation.candidate not in payload.keys():
-                    payload[recommendation.candidate] = [(recommendation.recommending_senior, recommendation.reason)]
-                else:
-                    payload[recommendation.candidate].append((recommendation.recommending_senior, recommendation.reason))
-        return payload
+    def getActiveRecommendations(self, cursor=None):
+        ''' One keyset page (by name) of the candidates with pending recommendations
+            for this senior, as (payload, next_cursor), where payload is a dictionary
+            whose keys are the candidates and values lists of tuples of (recommending
+            senior, reason for recommendation). Two queries, however many there are. '''
+        candidates = Candidate.objects.filter(candidates__recommended_senior_id=self.user_id, candidates__status=False).distinct().only('first_name', 'last_name')
+        page, next_cursor = keysetPaginate(candidates, CandidateQuerySet.SORT_KEYS['name'], cursor, settings.PAGE_SIZE)
+        payload = {candidate: [] for candidate in page}
+        by_id = {candidate.pk: candidate for candidate in page}
+        pending = Recommendation.objects.filter(recommended_senior_id=self.user_id, status=False, candidate_id__in=list(by_id))
+        for recommendation in pending.select_related('recommending_senior').order_by('pk'):
+            payload[by_id[recommendation.candidate_id]].append((recommendation.recommending_senior, recommendation.reason))
+        return payload, next_cursor
+
+    @staticmethod
+    def activeRecommendationsCacheKey(user_id):
+        return 'recportal:active_recommendations:{}'.format(user_id)
+
+    @staticmethod
+    def candidatesCacheKey(user_id):
+        return 'recportal:candidates_version:{}'.format(user_id)
+
+    @staticmethod
+    def invalidateRecommendationCaches(user_ids):
+        ''' drop the cached badge counts and "My Candidates" pages of the given users.
+            Needed wherever recommendations are written without sending signals
+            (bulk_create, update). '''
+        cache.delete_many([Senior.activeRecommendationsCacheKey(user_id) for user_id in user_ids] +
+                          [Senior.candidatesCacheKey(user_id) for user_id in user_ids])
 
     @property
     def active_recommendations_count(self):
-        return len(self.getActiveRecommendations())
+        ''' The number of candidates with pending recommendations for this senior.
+            This is rendered on every page (see base.html), so it is computed with
+            a single aggregate query and cached until a recommendation for this
+            senior is saved or deleted (see recportal/signals.py). '''
+        return cache.get_or_set(
+            Senior.activeRecommendationsCacheKey(self.user_id),
+            lambda: Recommendation.objects.filter(recommended_senior_id=self.user_id, status=False).values('candidate').distinct().count(),
+            settings.RECOMMENDATIONS_COUNT_TIMEOUT,
+        )
 
     def getCandidates(self):
-        payload = set()
-        for recommendation in self.user.recommended.all():
-            if recommendation.status == True:
-                payload.add(recommendation.candidate)
-        return payload
+        ''' the candidates whose recommendations this senior has accepted (including
+            the ones they assessed themselves), as one distinct query '''
+        return Candidate.objects.filter(candidates__recommended_senior_id=self.user_id, candidates__status=True).distinct()
+
+    def getCandidatesPage(self, cursor=None):
+        ''' One keyset page of getCandidates() ordered by name, as (candidates, next_cursor).
+            Pages are cached for settings.MYCANDIDATES_CACHE_TIMEOUT seconds (set it to 0
+            to turn this off) under a per-senior version that is dropped whenever one of
+            their recommendations or candidates changes (see recportal/signals.py). '''
+        def page():
+            return keysetPaginate(self.getCandidates().listing(), CandidateQuerySet.SORT_KEYS['name'], cursor, settings.PAGE_SIZE)
+
+        if not settings.MYCANDIDATES_CACHE_TIMEOUT:
+            return page()
+        version = cache.get_or_set(Senior.candidatesCacheKey(self.user_id), lambda: uuid.uuid4().hex, None)
+        # the cursor comes from the query string, hashed to a valid memcached key
+        key = 'recportal:candidates:{}:{}:{}'.format(self.user_id, version, hashlib.md5((cursor or '').encode()).hexdigest())
+        return cache.get_or_set(key, page, settings.MYCANDIDATES_CACHE_TIMEOUT)
+
+class CandidateQuerySet(models.QuerySet):
+
+    # the orderings the candidate directory can be sorted by. Each one is backed
+    # by an index (see Candidate.Meta) and ends with the primary key so that it
+    # is a total order usable for keyset pagination.
+    SORT_KEYS = {
+        'name': ['first_name', 'last_name', 'pk'],
+        'skill': ['skill1', 'pk'],
+        'pitched': ['pitched', 'first_name', 'last_name', 'pk'],
+    }
+
+    def listing(self):
+        ''' the columns shown in candidate tables. The full about text can be
+            arbitrarily long, so only the first 140 characters of it are fetched
+            (as about_excerpt). '''
+        return self.defer('about').annotate(about_excerpt=Substr('about', 1, 140))
+
+    def filterBy(self, skill=None, pitched=None):
+        ''' the server-side filters of the candidate directory. Empty values are ignored. '''
+        queryset = self
+        if skill:
+            queryset = queryset.filter(Q(skill1__istartswith=skill) | Q(skill2__istartswith=skill))
+        if pitched == 'yes':
+            queryset = queryset.filter(pitched=True)
+        elif pitched == 'no':
+            queryset = queryset.filter(pitched=False)
+        return queryset
 
 class Candidate(models.Model):
     ''' The stand-alone model for each candidate appearing for the department's
@@ -68,9 +144,20 @@ class Candidate(models.Model):
     skill1 = models.CharField(max_length=100, default='', blank=True)
     skill2 = models.CharField(max_length=100, default='', blank=True)
     pitched = models.BooleanField(default=False, blank=True) # approved by the DVM as a whole
+    updated_at = models.DateTimeField(auto_now=True, db_index=True) # for the "changes since" queries of the API
 
-    class meta():
+    objects = CandidateQuerySet.as_manager()
+
+    class Meta():
         ordering = ['first_name', 'last_name']
+        # the name is the natural key of a candidate (it is what every candidate
+        # url is made of), so it is unique and every route resolves through this index
+        unique_together = [('first_name', 'last_name')]
+        indexes = [
+            models.Index(fields=['skill1'], name='candidate_skill1_idx'),
+            models.Index(fields=['skill2'], name='candidate_skill2_idx'),
+            models.Index(fields=['pitched', 'first_name', 'last_name'], name='candidate_pitched_idx'),
+        ]
 
     def __str__(self):
         return self.get_full_name()
@@ -79,6 +166,63 @@ class Candidate(models.Model):
         string = "{} {}".format(self.first_name, self.last_name)
         return string
 
+    @staticmethod
+    def profileCacheKey(candidate_id):
+        return 'recportal:profile_version:{}'.format(candidate_id)
+
+    @staticmethod
+    def profileCacheVersion(candidate_id):
+        ''' The version of the cached fragments of a candidate's profile page (see
+            profile.html). A random value rather than a counter, so that if the
+            version itself gets evicted, the old fragments can never be served again. '''
+        return cache.get_or_set(Candidate.profileCacheKey(candidate_id), lambda: uuid.uuid4().hex, None)
+
+    @staticmethod
+    def invalidateProfileCache(candidate_id):
+        cache.delete(Candidate.profileCacheKey(candidate_id))
+
+class AssessmentQuerySet(models.QuerySet):
+
+    def withRelations(self):
+        ''' join in everything the assessment tables render (candidate, senior and task)
+            so that listing N assessments costs one query instead of 3N + 1 '''
+        return self.select_related('candidate', 'senior', 'task')
+
+    def withTaskStatus(self, today=None):
+        ''' annotate the status of the task (task_status) and how many days late it
+            is (days_late), see TaskQuerySet.statusAnnotations '''
+        return self.annotate(**TaskQuerySet.statusAnnotations('task__', today))
+
+    def filterBy(self, team=None, senior=None, pitched=None, status=None):
+        ''' the server-side filters of the assessments page. Empty values are ignored. '''
+        queryset = self
+        if status in TaskQuerySet.STATUSES:
+            queryset = queryset.filter(TaskQuerySet.statusCondition(status, 'task__'))
+        if team:
+            queryset = queryset.filter(team=team)
+        if senior:
+            queryset = queryset.filter(senior_id=senior)
+        if pitched == 'yes':
+            queryset = queryset.filter(pitched=True)
+        elif pitched == 'no':
+            queryset = queryset.filter(pitched=False)
+        return queryset
+
+class SearchPosting(models.Model):
+    ''' One entry of the inverted index used to search candidates: the candidate
+        contains the term, weighted by where (names count more than skills, which
+        count more than the about text) and how often. Maintained by the Candidate
+        signals, see recportal/search.py. '''
+    term = models.CharField(max_length=40, null=False)
+    candidate = models.ForeignKey(Candidate, related_name='postings', null=False, on_delete=models.CASCADE)
+    weight = models.IntegerField(default=1)
+
+    class Meta():
+        unique_together = [('term', 'candidate')]
+
+    def __str__(self):
+        return self.term
+
 class Assessment(models.Model):
     ''' Whenever a candidate appears for recruitments they are surveyed by a senior
         department member and then if they are suitable, then they are assessd by
@@ -107,15 +251,85 @@ class Assessment(models.Model):
     senior = models.ForeignKey(User, related_name='assessments', null=False, on_delete=models.CASCADE)
     candidate = models.ForeignKey('recportal.Candidate', related_name='assessments', null=False, on_delete=models.CASCADE)
     pitched = models.BooleanField(default=False, blank=True) # approved by the assessing candidate
+    updated_at = models.DateTimeField(auto_now=True, db_index=True) # also bumped when the task changes
 
-    class meta():
-        order_with_respect_to = 'candidate'
+    objects = AssessmentQuerySet.as_manager()
+
+    class Meta():
+        unique_together = [('senior', 'candidate')]
 
     def __str__(self):
         string = "{} by  {}".format(self.candidate.get_full_name(), self.senior.get_full_name())
         return string
 
 
+class DaysBetween(Func):
+    ''' the number of days from the date start to the date end (negative if end is
+        before start). Django has no portable date difference, hence one per backend. '''
+
+    function = 'DATEDIFF'   # MySQL: DATEDIFF(end, start)
+
+    def __init__(self, end, start, **extra):
+        super(DaysBetween, self).__init__(end, start, output_field=IntegerField(), **extra)
+
+    def as_sqlite(self, compiler, connection):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(')
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ')
+
+class TaskQuerySet(models.QuerySet):
+
+    # the statuses tasks can be filtered by. 'casual' (no due date) overlaps with
+    # 'ongoing' and 'completed', the other three are exclusive.
+    STATUSES = ['overdue', 'ongoing', 'completed', 'casual']
+
+    @staticmethod
+    def statusCondition(status, prefix='', today=None):
+        ''' The condition a task (reached through prefix, e.g. 'task__') has to meet
+            to have the given status, the SQL counterpart of Task.is_overdue, is_ongoing
+            and is_casual. Written as plain comparisons on due_date and completion_date,
+            so that the filters can use the indexes on them. '''
+        today = today or datetime.date.today()
+        due, done = prefix + 'due_date', prefix + 'completion_date'
+        overdue = Q(**{due + '__lt': today, done + '__isnull': True}) | Q(**{done + '__gt': F(due)})
+        if status == 'overdue':
+            return overdue
+        if status == 'ongoing':
+            return Q(**{prefix + 'id__isnull': False, done + '__isnull': True}) & (Q(**{due + '__isnull': True}) | Q(**{due + '__gte': today}))
+        if status == 'completed':
+            return Q(**{done + '__isnull': False}) & (Q(**{due + '__isnull': True}) | Q(**{done + '__lte': F(due)}))
+        if status == 'casual':
+            return Q(**{prefix + 'id__isnull': False, due + '__isnull': True})
+        raise ValueError('Unknown task status {}.'.format(status))
+
+    @staticmethod
+    def statusAnnotations(prefix='', today=None):
+        ''' The task_status ('overdue', 'ongoing' or 'completed', None without a task)
+            and days_late (0 unless overdue) annotations of the tasks reached through
+            prefix. days_late counts up to the completion date, or to today for
+            ongoing tasks. '''
+        today = today or datetime.date.today()
+        due, done = prefix + 'due_date', prefix + 'completion_date'
+        status = Case(
+            When(Q(**{prefix + 'id__isnull': True}), then=Value(None)),
+            When(TaskQuerySet.statusCondition('overdue', prefix, today), then=Value('overdue')),
+            When(Q(**{done + '__isnull': True}), then=Value('ongoing')),
+            default=Value('completed'),
+            output_field=CharField(),
+        )
+        late = DaysBetween(Coalesce(done, Value(today, output_field=DateField())), F(due))
+        return {
+            'task_status': status,
+            'days_late': Coalesce(Greatest(late, Value(0)), Value(0)),
+        }
+
+    def withStatus(self, today=None):
+        return self.annotate(**TaskQuerySet.statusAnnotations('', today))
+
+    def filterStatus(self, status, today=None):
+        return self.filter(TaskQuerySet.statusCondition(status, '', today))
+
 class Task(models.Model):
     ''' This model accounts for the task assigned by the senior to the candidate
         and is in a way an extention of the Assessment model. '''
@@ -125,11 +339,28 @@ class Task(models.Model):
     issuing_date = models.DateField(null=False)
     due_date = models.DateField(null=True, blank=True)
     completion_date = models.DateField(null=True, blank=True)
-    rubric = models.FileField(upload_to="", default=None, blank=True)
+    rubric = models.FileField(upload_to="", default=None, blank=True, storage=ContentAddressedStorage())
+    rubric_filename = models.CharField(max_length=100, default='', blank=True) # the rubric is stored under its hash
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta():
+        # for the status filters, see TaskQuerySet.statusCondition
+        indexes = [
+            models.Index(fields=['due_date'], name='task_due_date_idx'),
+            models.Index(fields=['completion_date'], name='task_completion_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # a rubric that hasn't been stored yet still has the name it was uploaded with
+        if self.rubric and not self.rubric._committed:
+            self.rubric_filename = os.path.basename(self.rubric.name)[:100]
+        super(Task, self).save(*args, **kwargs)
+
     @property               # doing this allows us to call it conveniently in templates
     def is_casual(self):
         ''' Casual tasks are those without any due date. This function will
@@ -166,6 +397,47 @@ class Task(models.Model):
             else:
                 return False # cases II and III
 
+class RubricBlob(models.Model):
+    ''' The reference count of a rubric file in the content addressed storage (see
+        recportal/storage.py), i.e. the number of tasks using it. It is kept up to
+        date by the Task signals in recportal/signals.py, and files whose count has
+        been zero for a while are deleted by the gcrubrics management command. '''
+    name = models.CharField(max_length=100, primary_key=True)
+    references = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True) # when the count last changed
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def addReference(name, count=1):
+        if not RubricBlob.objects.filter(name=name).update(references=models.F('references') + count, updated_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    RubricBlob.objects.create(name=name, references=count)
+            except IntegrityError:  # created concurrently
+                RubricBlob.objects.filter(name=name).update(references=models.F('references') + count, updated_at=timezone.now())
+
+    @staticmethod
+    def dropReference(name):
+        RubricBlob.objects.filter(name=name).update(references=models.F('references') - 1, updated_at=timezone.now())
+
+class RubricUpload(models.Model):
+    ''' A chunked, resumable upload of a task rubric that is still in progress.
+        The chunks are appended to a staging file (see recportal/uploads.py) whose
+        size is the offset to resume from, and the rubric is attached to the
+        task once all of them have arrived. '''
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.ForeignKey(Task, related_name='uploads', null=False, on_delete=models.CASCADE)
+    senior = models.ForeignKey(User, related_name='uploads', null=False, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=100, null=False)
+    size = models.BigIntegerField(null=False)
+    sha256 = models.CharField(max_length=64, default='', blank=True) # of the whole file, optional
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
 class Recommendation(models.Model):
     ''' To enable the recommendations feature we use this model. Seniors can
          recommend candidates to other seniors who can either accept to interview
@@ -175,7 +447,46 @@ class Recommendation(models.Model):
     candidate = models.ForeignKey('recportal.Candidate', related_name="candidates", null=False, on_delete=models.CASCADE)
     recommending_senior = models.ForeignKey(User, related_name='recommendations_made', null=False, on_delete=models.CASCADE)
     recommended_senior = models.ForeignKey(User, related_name='recommended', null=False, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta():
+        # a senior recommends a candidate to another senior only once
+        unique_together = [('candidate', 'recommending_senior', 'recommended_senior')]
 
     def __str__(self):
         string = "{} to {}".format(self.candidate.first_name, self.recommended_senior.first_name)
         return string
+
+class Deletion(models.Model):
+    ''' A deleted Candidate, Assessment or Recommendation, so that the "changes
+        since" queries of the API (see recportal/api.py) can report it. Recorded
+        by the post_delete signals in recportal/signals.py, and kept for
+        API_SINCE_MAX_AGE (see the prunedeletions command). '''
+    model = models.CharField(max_length=20, null=False)  # the model_name, e.g. 'candidate'
+    object_id = models.IntegerField(null=False)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta():
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='deletion_model_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.model, self.object_id)
+
+class Event(models.Model):
+    ''' A live notification for a senior (see recportal/events.py), written in the
+        transaction of the change it is about and read by the polls of their tabs.
+        Kept for EVENTS_KEEP_SECONDS (see the pruneevents command). '''
+    user = models.ForeignKey(User, related_name='events', null=False, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, null=False)  # the event type, e.g. 'recommendations'
+    data = models.TextField(default='{}')  # JSON
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta():
+        indexes = [
+            models.Index(fields=['user', 'created'], name='event_user_idx'),
+        ]
+
+    def __str__(self):
+        return '{} for {}'.format(self.kind, self.user_id)
@@ -0,0 +1,88 @@
+import json
+import base64
+import datetime
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import Q
+
+
+def encodeCursor(values):
+    ''' turn the ordering values of the last row of a page into an opaque,
+        url-safe cursor string '''
+    payload = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decodeCursor(cursor):
+    ''' the inverse of encodeCursor. Returns None for a missing or tampered cursor
+        so that the caller simply falls back to the first page. '''
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def cursorValues(queryset, ordering, values):
+    ''' The decoded cursor values converted to the types of the ordering fields
+        (model fields or annotations of queryset). None if they don't fit, e.g.
+        a string for 'pk', so that a tampered cursor also means the first page. '''
+    if values is None or len(values) != len(ordering):
+        return None
+    converted = []
+    for name, value in zip(ordering, values):
+        name = name.lstrip('-')
+        try:
+            if name in queryset.query.annotations:
+                field = queryset.query.annotations[name].output_field
+            elif name == 'pk':
+                field = queryset.model._meta.pk
+            else:
+                field = queryset.model._meta.get_field(name)
+            value = field.to_python(value)
+            field.get_prep_value(value)
+        except (FieldDoesNotExist, FieldError, ValidationError, ValueError, TypeError):
+            return None
+        if value is None:
+            return None
+        converted.append(value)
+    return converted
+
+
+def keysetPaginate(queryset, ordering, cursor=None, page_size=50):
+    ''' Keyset (a.k.a. cursor or seek) pagination.
+
+        Instead of OFFSET, which makes the database walk and throw away every
+        row before the requested page, the page starts right after the ordering
+        values of the last row of the previous page. With an index on the
+        ordering columns every page costs the same no matter how deep it is.
+
+        ordering is a list of field names (optionally prefixed with '-') and must
+        end with a unique field, usually 'pk', so that the order is total.
+
+        Returns a tuple of (rows, next_cursor) where next_cursor is None on the
+        last page. '''
+    queryset = queryset.order_by(*ordering)
+    values = cursorValues(queryset, ordering, decodeCursor(cursor))
+    if values is not None:
+        condition = Q()
+        for i, field in enumerate(ordering):
+            lookup = '{}__lt' if field.startswith('-') else '{}__gt'
+            step = Q(**{lookup.format(field.lstrip('-')): values[i]})
+            for j in range(i):
+                step &= Q(**{ordering[j].lstrip('-'): values[j]})
+            condition |= step
+        queryset = queryset.filter(condition)
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    next_cursor = encodeCursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
@@ -0,0 +1,121 @@
+''' A thread-safe pool of DB-API connections, used by the pooled MySQL backend
+    (recportal/backends/mysql). Nothing in here is specific to a database. '''
+import threading
+from time import monotonic
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    ''' At most size connections are open at once. A request for a connection is
+        served, in order of preference, by
+
+            - an idle connection (a hit), after checking that it is still alive
+            - a new connection (a miss), if fewer than size are open
+            - waiting up to wait_timeout seconds for one to be released (a wait),
+              after which PoolTimeout is raised
+
+        Connections idle for more than idle_timeout seconds are closed rather than
+        handed out, which should be shorter than the server's wait_timeout. Idle
+        connections are reused most recently released first, so that the pool
+        shrinks back once the load goes down. '''
+
+    def __init__(self, size=10, idle_timeout=300, wait_timeout=10):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.condition = threading.Condition()
+        self.idle = []      # (connection, released at), the most recently released last
+        self.open = 0       # idle or in use
+        self.hits = self.misses = self.waits = self.timeouts = self.discarded = 0
+
+    def acquire(self, connect, isUsable):
+        ''' Return a connection, connect() opens a new one and isUsable(connection)
+            is the liveness check of idle ones. '''
+        deadline = monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            with self.condition:
+                self.closeIdle()
+                if self.idle:
+                    connection = self.idle.pop()[0]
+                elif self.open < self.size:
+                    self.open += 1
+                    self.misses += 1
+                    break
+                else:
+                    if not waited:
+                        self.waits += 1
+                        waited = True
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout('No database connection was released within {} seconds.'.format(self.wait_timeout))
+                    self.condition.wait(remaining)
+                    continue
+            # the liveness check is a round trip to the server, so it happens outside the lock
+            if isUsable(connection):
+                with self.condition:
+                    self.hits += 1
+                return connection
+            self.discard(connection)
+
+        try:
+            return connect()
+        except BaseException:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, connection):
+        with self.condition:
+            self.idle.append((connection, monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        ''' close a connection that must not be reused '''
+        closeQuietly(connection)
+        with self.condition:
+            self.open -= 1
+            self.discarded += 1
+            self.condition.notify()
+
+    def closeIdle(self):
+        ''' close the connections idle for too long, called with the lock held '''
+        now = monotonic()
+        # the least recently released come first
+        while self.idle and now - self.idle[0][1] > self.idle_timeout:
+            closeQuietly(self.idle.pop(0)[0])
+            self.open -= 1
+            self.discarded += 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'timeouts': self.timeouts,
+                'discarded': self.discarded, 'open': self.open, 'idle': len(self.idle),
+            }
+
+
+def closeQuietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+# by what the connections connect to, see DatabaseWrapper.pool
+pools = {}
+pools_lock = threading.Lock()
+
+
+def getPool(key, **options):
+    ''' the pool for key, created with options on first use '''
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(**options)
+        return pools[key]
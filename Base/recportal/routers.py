@@ -0,0 +1,73 @@
+''' Read replica routing.
+
+    ReplicaRouter sends the reads of GET (and HEAD/OPTIONS) requests to one of
+    the DATABASE_REPLICAS, chosen once per request so that a page reads from a
+    single replica, and everything else to the primary ('default'). Reads go to
+    the primary:
+
+        - outside of requests (management commands, the shell)
+        - for the rest of a request once it has written anything
+        - inside transactions on the primary
+        - for REPLICA_PIN_SECONDS after a user's POST (or other unsafe request),
+          by means of a cookie, so that users always see their own changes even
+          if the replicas lag behind
+
+    ReplicaMiddleware decides which requests may use the replicas and sets the
+    cookie. The queries run on each alias are counted in recportal/metrics.py. '''
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'recportal_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# whether the current request (i.e. thread) may read from a replica, and which one
+state = threading.local()
+
+
+def useReplicas(enabled):
+    state.replica = random.choice(settings.DATABASE_REPLICAS) if enabled and settings.DATABASE_REPLICAS else None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(state, 'replica', None)
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # read your own writes for the rest of the request
+        state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        databases = [DEFAULT_DB_ALIAS] + list(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    ''' Lets the reads of safe requests go to the replicas (see ReplicaRouter) and
+        pins a user to the primary for REPLICA_PIN_SECONDS after an unsafe one.
+        Should come before the session and authentication middleware, so that
+        they read from the same database as the view. '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        useReplicas(safe and PIN_COOKIE not in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            useReplicas(False)
+        if not safe and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from recportal.models import Candidate, SearchPosting
+
+TOKEN_RE = re.compile(r'[a-z0-9+#]+')
+STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'he', 'her', 'his',
+             'i', 'in', 'is', 'it', 'its', 'my', 'of', 'on', 'or', 'she', 'that', 'the', 'their', 'they', 'this',
+             'to', 'was', 'were', 'with'}
+
+# how much one occurrence of a term counts, by field
+FIELD_WEIGHTS = [('first_name', 10), ('last_name', 10), ('skill1', 5), ('skill2', 5), ('about', 1)]
+# so that a long about text repeating a word cannot outrank a matching name or skill
+MAX_ABOUT_WEIGHT = 3
+# shorter last words only match whole terms, a single letter would match most of the index
+MIN_PREFIX = 2
+
+
+def tokenize(text):
+    ''' lower case words of text (underscores, as used in names, separate words) '''
+    return [token[:40] for token in TOKEN_RE.findall(text.lower().replace('_', ' ')) if token not in STOPWORDS]
+
+
+def postings(candidate):
+    ''' the SearchPostings of a candidate, one per distinct term '''
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        terms = Counter(tokenize(getattr(candidate, field)))
+        for term, count in terms.items():
+            weights[term] += min(count, MAX_ABOUT_WEIGHT) * weight if field == 'about' else weight
+    return [SearchPosting(term=term, candidate_id=candidate.pk, weight=weight) for term, weight in weights.items()]
+
+
+def indexCandidates(candidates):
+    ''' (re)index the given candidates, with one DELETE and one batched INSERT '''
+    candidates = list(candidates)
+    with transaction.atomic():
+        SearchPosting.objects.filter(candidate_id__in=[candidate.pk for candidate in candidates]).delete()
+        SearchPosting.objects.bulk_create([posting for candidate in candidates for posting in postings(candidate)])
+
+
+def search(query, limit=20):
+    ''' Rank the candidates matching the words of query. The last word also matches
+        as a prefix (if it has at least MIN_PREFIX characters), so results show up
+        while typing. Candidates matching more of the words come first, then the
+        ones with the larger total weight. Every lookup is an index range scan on
+        term, so the cost depends on the number of matching postings, not on the
+        number of candidates.
+
+        Returns a list of candidates, each annotated with its score. '''
+    words = []
+    for term in tokenize(query):
+        if term not in words:
+            words.append(term)
+    if not words:
+        return []
+    conditions = [Q(term=word) for word in words]
+    if len(words[-1]) >= MIN_PREFIX:
+        # as a range rather than startswith, whose LIKE not every database (e.g.
+        # SQLite) runs on the index
+        prefix = words[-1]
+        conditions[-1] = Q(term__gte=prefix, term__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition |= other
+    # the number of query words a candidate matched, however many of its terms a
+    # prefix matched (e.g. "jav" matching both java and javascript counts once)
+    matched = [Max(Case(When(word, then=Value(1)), default=Value(0), output_field=IntegerField())) for word in conditions]
+    ranking = list(SearchPosting.objects.filter(condition).values('candidate')
+                   .annotate(matched=sum(matched[1:], matched[0]), score=Sum('weight')).order_by('-matched', '-score', 'candidate')[:limit])
+    candidates = Candidate.objects.listing().in_bulk([row['candidate'] for row in ranking])
+    results = []
+    for row in ranking:
+        candidate = candidates[row['candidate']]
+        candidate.score = row['score']
+        results.append(candidate)
+    return results
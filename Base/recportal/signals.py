@@ -1,3 +1,10 @@
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
 from recportal.models import *
 
 def autoAddSeniorProfile(instance, **kwargs):
@@ -6,3 +13,102 @@ def autoAddSeniorProfile(instance, **kwargs):
     except:
         print("Creating a default user profile. Update later.")
         Senior.objects.create(user=instance, team="None", seniority_level=1)
+
+def invalidateRecommendationCaches(instance, **kwargs):
+    ''' drop the cached badge count and "My Candidates" pages of the recommended
+        senior whenever one of their recommendations is created, accepted or deleted '''
+    Senior.invalidateRecommendationCaches([instance.recommended_senior_id])
+
+def invalidateCandidateProfile(sender, instance, **kwargs):
+    ''' bump the version of the cached profile fragments of the candidate that
+        the saved or deleted Candidate, Assessment, Task or Recommendation belongs to '''
+    if sender == Candidate:
+        Candidate.invalidateProfileCache(instance.pk)
+    else:
+        Candidate.invalidateProfileCache(instance.candidate_id)
+
+def invalidateCandidateHolders(instance, **kwargs):
+    ''' drop the cached "My Candidates" pages showing a saved candidate. When a
+        candidate is deleted, the deletion of its recommendations drops them. '''
+    seniors = Recommendation.objects.filter(candidate_id=instance.pk, status=True).values_list('recommended_senior_id', flat=True)
+    cache.delete_many([Senior.candidatesCacheKey(senior) for senior in seniors])
+
+def invalidateSeniorProfiles(instance, update_fields=None, **kwargs):
+    ''' the cached profile fragments of the candidates a user assessed show their
+        name, so renaming them bumps those (saving just the last_login doesn't) '''
+    if update_fields is not None and not set(update_fields) & {'username', 'first_name', 'last_name'}:
+        return
+    candidates = Assessment.objects.filter(senior_id=instance.pk).values_list('candidate_id', flat=True).distinct()
+    cache.delete_many([Candidate.profileCacheKey(candidate_id) for candidate_id in candidates])
+
+def rememberRubric(instance, **kwargs):
+    ''' keep the rubric a task was loaded with, to tell whether a save changed it '''
+    rubric = instance.__dict__.get('rubric')    # read raw, so deferred fields aren't loaded
+    if isinstance(rubric, FieldFile):
+        rubric = rubric.name if rubric._committed else ''
+    instance.stored_rubric = rubric if isinstance(rubric, str) else ''
+
+def countRubricReferences(instance, created, **kwargs):
+    ''' move a reference from the old to the new rubric blob when it changes '''
+    rubric = instance.rubric.name if instance.rubric else ''
+    if rubric != instance.stored_rubric:
+        if rubric:
+            RubricBlob.addReference(rubric)
+        if instance.stored_rubric:
+            RubricBlob.dropReference(instance.stored_rubric)
+        instance.stored_rubric = rubric
+
+def releaseRubric(instance, **kwargs):
+    if instance.stored_rubric:
+        RubricBlob.dropReference(instance.stored_rubric)
+
+def indexCandidate(instance, **kwargs):
+    ''' keep the search index of a candidate in sync, postings of deleted
+        candidates go away through the foreign key cascade '''
+    from recportal.search import indexCandidates
+    indexCandidates([instance])
+
+def touchAssessment(instance, created, **kwargs):
+    ''' a task is part of its assessment in the API, so changing it changes the assessment '''
+    if created:
+        return      # the assessment is created after its task
+    Assessment.objects.filter(task_id=instance.pk).update(updated_at=timezone.now())
+
+# the Deletions held back by batchDeletions, per thread
+pendingDeletions = threading.local()
+
+@contextmanager
+def batchDeletions():
+    ''' record the Deletions of the rows deleted inside the block (e.g. by a
+        queryset delete()) with one INSERT at its end, rather than one per row '''
+    pendingDeletions.rows = []
+    try:
+        yield
+        Deletion.objects.bulk_create(pendingDeletions.rows)
+    finally:
+        del pendingDeletions.rows
+
+def recordDeletion(sender, instance, **kwargs):
+    deletion = Deletion(model=sender._meta.model_name, object_id=instance.pk)
+    if hasattr(pendingDeletions, 'rows'):
+        pendingDeletions.rows.append(deletion)
+    else:
+        deletion.save()
+
+def publishRecommendation(instance, created, **kwargs):
+    ''' tell the recommended senior about a new recommendation (see recportal/events.py) '''
+    from recportal.events import notifyRecommendations
+    if created and instance.status:
+        return      # created accepted (e.g. 'Assessed by self'), nothing is pending
+    if created:
+        notifyRecommendations([instance.recommended_senior_id], instance.candidate, instance.recommending_senior)
+    else:
+        notifyRecommendations([instance.recommended_senior_id])
+
+def publishTask(instance, created, **kwargs):
+    ''' tell the senior assessing with the task that it changed '''
+    if created:
+        return
+    from recportal.events import publish
+    seniors = Assessment.objects.filter(task_id=instance.pk).values_list('senior_id', flat=True)
+    publish(seniors, 'task', {'id': instance.pk, 'title': instance.title})
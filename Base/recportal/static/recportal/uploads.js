@@ -0,0 +1,64 @@
+// Chunked, resumable rubric uploads (see recportal/uploads.py), used by the
+// forms that attach a rubric to a task. A dropped connection only costs the
+// current chunk, and picking the same file again after a reload resumes where
+// the upload stopped. The page defines uploadsUrl, the startupload url.
+
+function csrfToken() {
+  return document.getElementsByName('csrfmiddlewaretoken')[0].value;
+}
+
+async function sha256(blob) {
+  var digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(function(b) { return b.toString(16).padStart(2, '0'); }).join('');
+}
+
+async function request(url, options) {
+  // retry network failures a few times, http errors are returned to the caller
+  for (var attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, Object.assign({credentials: 'same-origin'}, options));
+    } catch (err) {
+      if (attempt >= 5) throw err;
+      await new Promise(function(resolve) { setTimeout(resolve, 1000 * (attempt + 1)); });
+    }
+  }
+}
+
+async function uploadRubric(task, file, status) {
+  var key = ['rubric-upload', task, file.name, file.size, file.lastModified].join(':');
+  var id = localStorage.getItem(key), state = null;
+  if (id) {
+    var response = await request(uploadsUrl + id + '/');
+    state = response.ok ? await response.json() : null;
+  }
+  if (!state) {
+    var form = new FormData();
+    form.append('task', task);
+    form.append('filename', file.name);
+    form.append('size', file.size);
+    var response = await request(uploadsUrl, {method: 'POST', body: form, headers: {'X-CSRFToken': csrfToken()}});
+    state = await response.json();
+    if (!response.ok) throw new Error(state.error_message);
+    id = state.id;
+    localStorage.setItem(key, id);
+  }
+
+  var offset = state.offset;
+  while (offset < file.size) {
+    status.textContent = 'uploading rubric... ' + Math.floor(100 * offset / file.size) + '%';
+    var chunk = file.slice(offset, offset + state.chunk_size);
+    var response = await request(uploadsUrl + id + '/?offset=' + offset, {
+      method: 'POST', body: chunk,
+      headers: {'X-CSRFToken': csrfToken(), 'X-Chunk-SHA256': await sha256(chunk), 'Content-Type': 'application/octet-stream'}
+    });
+    var result = await response.json();
+    if (!response.ok && result.offset === undefined) throw new Error(result.error_message);
+    offset = result.offset;
+  }
+
+  var response = await request(uploadsUrl + id + '/complete/', {method: 'POST', headers: {'X-CSRFToken': csrfToken()}});
+  var result = await response.json();
+  localStorage.removeItem(key);
+  if (!response.ok) throw new Error(result.error_message);
+  status.textContent = '';
+}
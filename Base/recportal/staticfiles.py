@@ -0,0 +1,196 @@
+''' The static files pipeline.
+
+    collectstatic (with CompressedManifestStaticFilesStorage) writes every file
+    under a name containing the hash of its content (e.g. favicon.3f2a9c.ico),
+    next to gzip and, if the brotli package is installed, brotli compressed
+    copies of the text files. The images listed in STATIC_IMAGE_VARIANTS also get
+    resized JPEG and WebP copies (this needs Pillow, without it they are skipped).
+
+    Since a hashed name always refers to the same content, serveStatic marks them
+    as immutable, so browsers never ask for them again. The front web server
+    should do the same for STATIC_ROOT when it serves it, e.g. for nginx:
+
+        location ~ "^/static/.+\.[0-9a-f]{12}\." {
+            gzip_static on;
+            brotli_static on;
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+'''
+import os
+import gzip
+import mimetypes
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# worth compressing, images and fonts already are
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.html', '.json', '.map', '.xml')
+# (Content-Encoding, file suffix) in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def variantName(name, width, extension):
+    ''' e.g. recportal/Background.480w.webp, or recportal/Background.webp at full width '''
+    base = os.path.splitext(name)[0]
+    if width:
+        return '{}.{}w.{}'.format(base, width, extension)
+    return '{}.{}'.format(base, extension)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        try:
+            return super(CompressedManifestStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            # not collected (yet), which only costs caching, see serveStatic
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths.update(self.makeImageVariants(paths))
+        for processed in super(CompressedManifestStaticFilesStorage, self).post_process(paths, dry_run, **options):
+            yield processed
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(COMPRESSIBLE):
+                    self.compress(name)
+
+    def makeImageVariants(self, paths):
+        ''' write the resized and WebP copies of STATIC_IMAGE_VARIANTS, returns them
+            in the format of paths so that they get hashed like the other files '''
+        try:
+            from PIL import Image
+        except ImportError:
+            return {}
+        variants = {}
+        for name, widths in settings.STATIC_IMAGE_VARIANTS.items():
+            if name not in paths:
+                continue
+            storage, path = paths[name]
+            with storage.open(path) as f:
+                image = Image.open(f)
+                image.load()
+            image = image.convert('RGB')
+            for width in [None] + sorted(widths):
+                if width is None:
+                    resized, formats = image, [('webp', 'WEBP')]     # the original is the JPEG
+                elif width < image.width:
+                    resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                    formats = [('jpg', 'JPEG'), ('webp', 'WEBP')]
+                else:
+                    continue
+                for extension, image_format in formats:
+                    buffer = BytesIO()
+                    resized.save(buffer, image_format, quality=80, optimize=True)
+                    variant = variantName(name, width, extension)
+                    if self.exists(variant):
+                        self.delete(variant)
+                    self._save(variant, ContentFile(buffer.getvalue()))
+                    variants[variant] = (self, variant)
+        return variants
+
+    def compress(self, name):
+        ''' write the compressed copies of name, when they are smaller '''
+        with self.open(name) as f:
+            content = f.read()
+        compressed = [('.gz', gzip.compress(content, 9))]
+        try:
+            import brotli
+        except ImportError:
+            pass
+        else:
+            compressed.append(('.br', brotli.compress(content)))
+        for suffix, data in compressed:
+            if len(data) < len(content):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+
+
+def imageVariants(name):
+    ''' The collected variants of an image in STATIC_IMAGE_VARIANTS as a list of
+        {'width', 'jpg', 'webp'} urls, the full width one (width None) first and
+        then narrower and narrower. Empty until collectstatic has made them. '''
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    variants = []
+    for width in [None] + sorted(settings.STATIC_IMAGE_VARIANTS.get(name, []), reverse=True):
+        jpg = name if width is None else variantName(name, width, 'jpg')
+        webp = variantName(name, width, 'webp')
+        if jpg in hashed_files and webp in hashed_files:
+            variants.append({'width': width, 'jpg': staticfiles_storage.url(jpg), 'webp': staticfiles_storage.url(webp)})
+    return variants
+
+
+@lru_cache(maxsize=None)
+def hashedNames():
+    ''' the hashed names of the manifest (as of the start of the process) '''
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def acceptedEncodings(header):
+    ''' the codings of an Accept-Encoding header, leaving out the ones refused
+        with q=0 '''
+    accepted = []
+    for value in header.split(','):
+        coding, _, params = value.partition(';')
+        quality = 1
+        for param in params.split(';'):
+            name, _, number = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0
+        if coding.strip() and quality > 0:
+            accepted.append(coding.strip().lower())
+    return accepted
+
+
+def serveStatic(request, path):
+    ''' Serve a collected static file from STATIC_ROOT, precompressed if the
+        client accepts it. Hashed names are cached for a year and never
+        revalidated, other files are revalidated with If-Modified-Since. A HEAD
+        request gets the headers only, without the file being opened. '''
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    hashed = path in hashedNames()
+    stat = os.stat(fullpath)
+    if not hashed and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    accepted = acceptedEncodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.isfile(fullpath + suffix):
+            encoding, fullpath = candidate, fullpath + suffix
+            break
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    response['Content-Length'] = os.path.getsize(fullpath)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if hashed:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
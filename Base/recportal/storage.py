@@ -0,0 +1,77 @@
+import os
+import hashlib
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+READ_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    ''' Stores every file under the sha256 of its content, sharded into two levels
+        of subdirectories (e.g. 3f/a2/3fa2...e1.pdf), so no directory grows large
+        and identical files are only stored once. The extension is kept so the
+        MIME type can still be told from the name.
+
+        The original filename has to be kept by the caller (see Task.rubric_filename)
+        and the number of references to each stored file is counted in RubricBlob,
+        so that the gcrubrics command can remove the unreferenced ones. '''
+
+    def blobName(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()[:10]
+        return '{}/{}/{}{}'.format(digest[:2], digest[2:4], digest, extension)
+
+    def touch(self, path):
+        ''' mark an existing file as just reused, so that gcrubrics leaves it alone
+            even if its reference count is still zero until the task is saved '''
+        os.utime(path, None)
+
+    def get_available_name(self, name, max_length=None):
+        # names are derived from the content, an existing file with the same name
+        # is the same file and is reused rather than renamed
+        return name
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # already on disk (large uploads), hash it in place and move it if it is new
+            digest = hashlib.sha256()
+            with open(content.temporary_file_path(), 'rb') as f:
+                for block in iter(lambda: f.read(READ_SIZE), b''):
+                    digest.update(block)
+            name = self.blobName(digest.hexdigest(), name)
+            path = self.path(name)
+            if os.path.exists(path):
+                self.touch(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+        else:
+            # hash while writing to a temporary file next to the shards, then rename it
+            # into place. Two identical uploads racing each other write the same bytes.
+            os.makedirs(self.location, exist_ok=True)
+            digest = hashlib.sha256()
+            fd, temporary = tempfile.mkstemp(dir=self.location, prefix='.incoming-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        f.write(chunk)
+                name = self.blobName(digest.hexdigest(), name)
+                path = self.path(name)
+                if os.path.exists(path):
+                    os.remove(temporary)
+                    self.touch(path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return name.replace('\\', '/')
@@ -0,0 +1,12 @@
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    ''' The default runner, except that the tests tagged 'benchmark' (which seed
+        up to 10^5 rows and take minutes) only run when asked for, with
+            python manage.py test --tag=benchmark '''
+
+    def __init__(self, tags=None, exclude_tags=None, **kwargs):
+        if not tags or 'benchmark' not in tags:
+            exclude_tags = list(exclude_tags or []) + ['benchmark']
+        super(TestRunner, self).__init__(tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -1,3 +1,1215 @@
-from django.test import TestCase
+import os
+import csv
+import json
+import time
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.db import router
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from recportal.models import *
+from recportal import exporter, metrics
+from recportal import dashboard
+from recportal.auth import SeniorBackend, SeniorMiddleware
+from recportal.downloads import parseRange
+from recportal.events import eventId, publish
+from recportal.importer import SheetError, cellText, importCandidates, readRows, validateRow
+from recportal.pagination import encodeCursor, keysetPaginate
+from recportal.pool import ConnectionPool, PoolTimeout
+from recportal.routers import ReplicaMiddleware, useReplicas
+from recportal.search import indexCandidates, search
+from recportal.signals import batchDeletions
+from recportal.staticfiles import hashedNames
+from recportal.uploads import UploadError, appendChunk, expireUploads, stagingPath
+
+
+@tag('benchmark')
+class CandidateLookupBenchmark(TestCase):
+    ''' Every candidate route resolves first_name/last_name to a candidate. This
+        checks that the lookup goes through the unique name index and that its
+        cost stays flat as the table grows from 10^3 to 10^5 candidates. '''
+
+    SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+    LOOKUPS = 200
+
+    def seed(self, upto):
+        start = Candidate.objects.count()
+        Candidate.objects.bulk_create(
+            [Candidate(first_name='first_{}'.format(i), last_name='last{}'.format(i), ph='9999999999', email='c{}@example.com'.format(i)) for i in range(start, upto)]
+        )
+
+    def timeLookups(self, size):
+        names = [('first_{}'.format(i), 'last{}'.format(i)) for i in range(0, size, size // self.LOOKUPS)]
+        start = time.perf_counter()
+        for first_name, last_name in names:
+            Candidate.objects.get(first_name=first_name, last_name=last_name)
+        return (time.perf_counter() - start) / len(names)
+
+    def test_lookup_uses_index(self):
+        self.seed(10)
+        queryset = Candidate.objects.filter(first_name='first_1', last_name='last1')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+                self.assertIn('INDEX', plan)
+            elif connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [column[0] for column in cursor.description]
+                plan = dict(zip(columns, cursor.fetchone()))
+                self.assertIsNotNone(plan['key'])
+                self.assertNotEqual(plan['type'], 'ALL')
+
+    def test_lookup_cost_is_flat(self):
+        timings = {}
+        for size in self.SIZES:
+            self.seed(size)
+            self.timeLookups(size)  # warm up
+            timings[size] = self.timeLookups(size)
+        # a full table scan would be ~100 times slower at 10^5 rows than at 10^3
+        self.assertLess(timings[self.SIZES[-1]], timings[self.SIZES[0]] * 5)
+
+
+def letters(i):
+    ''' candidate urls only allow letters in names, so number them in base 26 '''
+    name = ''
+    while True:
+        name = chr(ord('a') + i % 26) + name
+        i //= 26
+        if not i:
+            return name
+
+
+def seedPortal(n, media_root):
+    ''' Data factory for the view benchmarks. Creates n candidates, n // 10
+        (at least 5) seniors, an assessment with a task for every candidate,
+        an assessment of the first candidate by every senior and a recommendation
+        of every candidate to the first senior (pending for even, accepted for
+        odd candidates). Returns (first senior, first candidate, rubric name). '''
+    rubric = 'bench.pdf'
+    with open(os.path.join(media_root, rubric), 'wb') as f:
+        f.write(os.urandom(256 * 1024))
+
+    teams = ['App Dev', 'Backend', 'Frontend', 'Graphics', 'Video']
+    seniors = max(5, n // 10)
+    User.objects.bulk_create([User(username='senior{}'.format(i), first_name='Senior', last_name='S{}'.format(i)) for i in range(seniors)])
+    users = list(User.objects.order_by('pk'))
+    Senior.objects.bulk_create([Senior(user=user, team=teams[i % len(teams)], seniority_level=1) for i, user in enumerate(users)])
+
+    Candidate.objects.bulk_create([Candidate(first_name='first_{}'.format(letters(i)), last_name='last', ph='9999999999', email='c{}@example.com'.format(i),
+                                             about='about ' * 50, skill1='skill{}'.format(i % 7)) for i in range(n)])
+    candidates = list(Candidate.objects.order_by('pk'))
+
+    pairs = [(users[i % seniors], candidate) for i, candidate in enumerate(candidates)]
+    pairs += [(user, candidates[0]) for user in users[1:]]
+    Task.objects.bulk_create([Task(title='task', description='description', candidate=candidate, issuing_date=datetime.date(2018, 1, 1),
+                                   due_date=datetime.date(2018, 1, 10), rubric=rubric) for _, candidate in pairs])
+    tasks = list(Task.objects.order_by('pk'))
+    Assessment.objects.bulk_create([Assessment(team='Backend', task=task, senior=user, candidate=candidate) for (user, candidate), task in zip(pairs, tasks)])
+
+    Recommendation.objects.bulk_create([Recommendation(candidate=candidate, recommending_senior=users[1], recommended_senior=users[0], status=bool(i % 2))
+                                        for i, candidate in enumerate(candidates)])
+    return users[0], candidates[0], rubric
+
+
+@tag('benchmark')
+class ViewBenchmark(TestCase):
+    ''' Drives every recportal view through the test client at several data sizes
+        and records latency percentiles and SQL query counts. Fails if the number
+        of queries, or the median latency beyond LATENCY_GROWTH, of any view grows
+        with the amount of data, and reports the numbers of every view if it does.
+
+        The sizes can be overridden with RECPORTAL_BENCH_SIZES, e.g.
+            RECPORTAL_BENCH_SIZES=100,1000,10000 python manage.py test --tag=benchmark '''
+
+    SIZES = [int(size) for size in os.environ.get('RECPORTAL_BENCH_SIZES', '10,100,1000').split(',')]
+    REPEATS = 10
+    # how much slower than at the smallest size a view may be at the largest one
+    LATENCY_GROWTH = 5
+    LATENCY_SLACK_MS = 10
+
+    def views(self, candidate, rubric):
+        name = {'first_name': candidate.first_name, 'last_name': candidate.last_name}
+        return {
+            'candidates': reverse('recportal:candidates'),
+            'profile': reverse('recportal:profile', kwargs=name),
+            'assessments': reverse('recportal:assessments'),
+            'myassessments': reverse('recportal:myassessments'),
+            'mycandidates': reverse('recportal:mycandidates'),
+            'recommendations': reverse('recportal:recommendations'),
+            'recommend': reverse('recportal:recommend', kwargs=name),
+            'download': reverse('recportal:download', kwargs={'filename': rubric}),
+        }
+
+    def measure(self, url):
+        ''' returns (query count, sorted latencies in ms) of GET url '''
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # captured_queries is read lazily from the connection, which the next request resets
+        count = len(queries)
+        latencies = []
+        for _ in range(self.REPEATS):
+            start = time.perf_counter()
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return count, sorted(latencies)
+
+    def percentile(self, latencies, p):
+        return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+
+    def test_views_scale(self):
+        results = {}
+        for size in self.SIZES:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                cache.clear()
+                for model in (Recommendation, Assessment, Task, Candidate, Senior, User):
+                    model.objects.all().delete()
+                senior, candidate, rubric = seedPortal(size, media_root)
+                self.client.force_login(senior)
+                for view, url in self.views(candidate, rubric).items():
+                    results[(view, size)] = self.measure(url)
+
+        report = ['{:<16} {:>7} {:>8} {:>9} {:>9} {:>9}'.format('view', 'N', 'queries', 'p50 ms', 'p90 ms', 'p99 ms')]
+        growing, slowing = [], []
+        for view in self.views(candidate, rubric):
+            for size in self.SIZES:
+                queries, latencies = results[(view, size)]
+                report.append('{:<16} {:>7} {:>8} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                    view, size, queries, self.percentile(latencies, 50), self.percentile(latencies, 90), self.percentile(latencies, 99)))
+            (first_queries, first_latencies), (last_queries, last_latencies) = results[(view, self.SIZES[0])], results[(view, self.SIZES[-1])]
+            if last_queries > first_queries:
+                growing.append(view)
+            # every page is bounded (paginated or cached), so its latency must not follow N
+            if self.percentile(last_latencies, 50) > self.percentile(first_latencies, 50) * self.LATENCY_GROWTH + self.LATENCY_SLACK_MS:
+                slowing.append(view)
+        report = '\n'.join(report)
+        self.assertEqual(growing, [], 'query count grows with N for: {}\n{}'.format(', '.join(growing), report))
+        self.assertEqual(slowing, [], 'latency grows with N for: {}\n{}'.format(', '.join(slowing), report))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(SimpleTestCase):
+    ''' which database the reads of a request are routed to (see recportal/routers.py) '''
+
+    def readsFrom(self, request, write=False):
+        aliases = []
+
+        def view(request):
+            aliases.append(router.db_for_read(Candidate))
+            if write:
+                router.db_for_write(Candidate)
+                aliases.append(router.db_for_read(Candidate))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return aliases, response
+
+    def test_get_reads_from_replica(self):
+        aliases, response = self.readsFrom(RequestFactory().get('/'))
+        self.assertEqual(aliases, ['replica'])
+        self.assertNotIn('recportal_primary', response.cookies)
+        # and nothing outside of requests does
+        self.assertEqual(router.db_for_read(Candidate), 'default')
+
+    def test_writes_are_read_back_from_primary(self):
+        aliases, _ = self.readsFrom(RequestFactory().get('/'), write=True)
+        self.assertEqual(aliases, ['replica', 'default'])
+
+    def test_post_pins_to_primary(self):
+        factory = RequestFactory()
+        aliases, response = self.readsFrom(factory.post('/'))
+        self.assertEqual(aliases, ['default'])
+        self.assertIn('recportal_primary', response.cookies)
+
+        factory.cookies['recportal_primary'] = '1'
+        aliases, _ = self.readsFrom(factory.get('/'))
+        self.assertEqual(aliases, ['default'])
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.alive = True
+
+    def close(self):
+        self.alive = False
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    ''' the pool of the pooled MySQL backend, with stand-in connections '''
+
+    def acquire(self, pool):
+        return pool.acquire(FakeConnection, lambda connection: connection.alive)
+
+    def test_reuses_released_connections(self):
+        pool = ConnectionPool(size=2)
+        first = self.acquire(pool)
+        pool.release(first)
+        self.assertIs(self.acquire(pool), first)
+        self.assertEqual((pool.hits, pool.misses), (1, 1))
+
+    def test_discards_dead_and_idle_connections(self):
+        pool = ConnectionPool(size=2, idle_timeout=0.01)
+        dead = self.acquire(pool)
+        pool.release(dead)
+        dead.alive = False
+        self.assertIsNot(self.acquire(pool), dead)
+
+        idle = self.acquire(pool)
+        pool.release(idle)
+        time.sleep(0.02)
+        self.assertIsNot(self.acquire(pool), idle)
+        self.assertFalse(idle.alive)
+        self.assertEqual(pool.stats()['discarded'], 2)
+        self.assertEqual(pool.stats()['open'], 2)
+
+    def test_waits_for_a_connection_up_to_the_limit(self):
+        pool = ConnectionPool(size=1, wait_timeout=0.05)
+        connection = self.acquire(pool)
+        with self.assertRaises(PoolTimeout):
+            self.acquire(pool)
+        self.assertEqual((pool.waits, pool.timeouts), (1, 1))
+
+
+class EventsTest(TestCase):
+    ''' the live notifications, polled by the tabs of the signed in seniors '''
+
+    def setUp(self):
+        cache.clear()
+        self.senior, self.other = [User.objects.create_user(name, password=name, first_name=name, last_name='B') for name in ('senior', 'other')]
+        self.client.force_login(self.senior)
+
+    def poll(self, since):
+        last_event_id = since if isinstance(since, int) else str(eventId(since)) if since else ''
+        response = self.client.get(reverse('recportal:events'), HTTP_LAST_EVENT_ID=str(last_event_id))
+        return [(block.split('\n')[1][len('event: '):], json.loads(block.split('\n')[2][len('data: '):]))
+                for block in response.content.decode().split('\n\n') if block.startswith('id: ')]
+
+    def age(self, seconds):
+        Event.objects.update(created=timezone.now() - datetime.timedelta(seconds=seconds))
+
+    def test_delivers_the_events_of_the_user_since_the_last_one(self):
+        since = timezone.now() - datetime.timedelta(seconds=60)
+        publish([self.senior.pk, self.other.pk], 'task', {'id': 1})
+        self.age(30)
+        self.assertEqual(self.poll(since), [('recommendations', {'count': 0}), ('task', {'id': 1})])
+        self.assertEqual(self.poll(timezone.now() - datetime.timedelta(seconds=20)), [('recommendations', {'count': 0})])
+
+    def test_holds_back_events_that_may_not_be_committed_everywhere_yet(self):
+        publish([self.senior.pk], 'task', {'id': 1})
+        self.assertEqual(self.poll(timezone.now() - datetime.timedelta(seconds=60)), [('recommendations', {'count': 0})])
+
+    def test_first_poll_only_gets_the_count(self):
+        candidate = Candidate.objects.create(first_name='X', last_name='Y', ph='1234567890', email='x@y.z')
+        Recommendation.objects.create(candidate=candidate, recommending_senior=self.other, recommended_senior=self.senior)
+        self.age(30)
+        self.assertEqual(self.poll(None), [('recommendations', {'count': 1})])
+        self.assertEqual(self.poll(timezone.now() - datetime.timedelta(seconds=60))[1:],
+                         [('recommendations', {'count': 1, 'candidate': 'X Y', 'senior': 'other B'})])
+
+    def test_last_event_ids_far_in_the_future_are_ignored(self):
+        publish([self.senior.pk], 'task', {'id': 1})
+        self.age(30)
+        self.assertEqual(self.poll(10 ** 20), [('recommendations', {'count': 0})])
+
+    def test_old_events_are_pruned(self):
+        publish([self.senior.pk], 'task', {'id': 1})
+        self.age(settings.EVENTS_KEEP_SECONDS + 60)
+        publish([self.senior.pk], 'task', {'id': 2})
+        call_command('pruneevents', stdout=StringIO())
+        self.assertEqual([json.loads(data)['id'] for data in Event.objects.values_list('data', flat=True)], [2])
+
+
+class AssessCandidateTest(TestCase):
+    ''' assessing a candidate creates the task, assessment and self recommendation at once '''
+
+    def setUp(self):
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        self.candidate = Candidate.objects.create(first_name='X', last_name='Y', ph='1234567890', email='x@y.z')
+        self.client.force_login(self.senior)
+        self.url = reverse('recportal:assess', kwargs={'first_name': 'X', 'last_name': 'Y'})
+        self.form = {'team': 'Backend', 'title': 'Task', 'description': 'Do it', 'issuing_date': '2020-01-01', 'due_date': ''}
+
+    def test_creates_everything_in_one_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, self.form)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        assessment = Assessment.objects.get(senior=self.senior, candidate=self.candidate)
+        self.assertIsNone(assessment.task.due_date)
+        self.assertTrue(Recommendation.objects.get(candidate=self.candidate, recommended_senior=self.senior).status)
+
+    def test_assesses_a_candidate_once(self):
+        self.client.post(self.url, self.form)
+        self.client.post(self.url, self.form)
+        self.assertEqual(Assessment.objects.count(), 1)
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(Recommendation.objects.count(), 1)
+
+    def test_other_integrity_errors_are_not_taken_for_a_second_assessment(self):
+        def recommendMeanwhile(instance, **kwargs):
+            # as if the candidate was recommended to the senior concurrently
+            Recommendation.objects.create(status=True, candidate=instance.candidate, recommending_senior=instance.senior, recommended_senior=instance.senior)
+        post_save.connect(recommendMeanwhile, sender=Assessment)
+        try:
+            with self.assertRaises(IntegrityError):
+                self.client.post(self.url, self.form)
+        finally:
+            post_save.disconnect(recommendMeanwhile, sender=Assessment)
+        self.assertFalse(Assessment.objects.exists())
+
+
+class ImportCandidatesTest(TestCase):
+    ''' bulk imports of registration sheets, see recportal/importer.py '''
+
+    HEADER = ['First Name', 'Last Name', 'Ph', 'Email', 'Skill1']
+    ROWS = [
+        ['Ann', 'Lee', '9876543210', 'ann@x.com', 'python'],
+        ['', '', '', '', ''],                                   # skipped
+        ['Bob', 'Ray', '123', 'bob@x.com', ''],                 # invalid phone
+        ['Cid', 'Kay', 9876543210, 'cid@x.com', 'java'],        # a number cell
+        ['Ann', 'Lee', '9876543210', 'ann2@x.com', ''],         # twice in the sheet
+        ['Dan', 'Orr', '9876543210', 'dan@x.com', ''],          # already a candidate
+        ['Eve', 'Poe', '9876543210', 'eve@x.com', ''],
+    ]
+
+    def setUp(self):
+        Candidate.objects.create(first_name='Dan', last_name='Orr', ph='1234567890', email='d@x.com')
+
+    def csvFile(self, rows=None):
+        text = StringIO()
+        csv.writer(text).writerows([self.HEADER] + (rows or self.ROWS))
+        return BytesIO(text.getvalue().encode('utf-8'))
+
+    def xlsxFile(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        for row in [self.HEADER] + self.ROWS:
+            workbook.active.append([value if value != '' else None for value in row])
+        f = BytesIO()
+        workbook.save(f)
+        f.seek(0)
+        return f
+
+    def runImport(self, rows, **kwargs):
+        report = StringIO()
+        counts = importCandidates(rows, csv.writer(report), **kwargs)
+        return counts, [row[:2] for row in csv.reader(StringIO(report.getvalue()))][1:]
+
+    def test_reads_csv_and_xlsx_alike(self):
+        for f, filename in ((self.csvFile(), 'sheet.CSV'), (self.xlsxFile(), 'sheet.xlsx')):
+            rows = list(readRows(f, filename))
+            self.assertEqual([number for number, _ in rows], [2, 4, 5, 6, 7, 8], filename)
+            self.assertEqual(rows[2][1]['ph'], '9876543210', filename)
+            self.assertEqual(rows[0][1]['first_name'], 'Ann', filename)
+        self.assertEqual(cellText(9876543210.0), '9876543210')     # what spreadsheets store phone numbers as
+
+    def test_refuses_unknown_formats_and_missing_columns(self):
+        with self.assertRaises(SheetError):
+            list(readRows(BytesIO(b'a,b'), 'sheet.ods'))
+        with self.assertRaises(SheetError):
+            list(readRows(BytesIO(b'first_name,last_name\nA,B\n'), 'sheet.csv'))
+        with self.assertRaises(SheetError):
+            list(readRows(BytesIO(b''), 'sheet.csv'))
+
+    def test_validates_rows_like_the_form(self):
+        self.assertEqual(validateRow({'first_name': 'Ann', 'last_name': 'Lee', 'ph': '9876543210', 'email': 'x'})[1], 'Invalid email address.')
+        self.assertEqual(validateRow({'first_name': 'Ann', 'last_name': '', 'ph': '9876543210', 'email': 'a@x.com'})[1], 'Essential data missing.')
+        candidate, error = validateRow({'first_name': 'Mary Ann', 'last_name': 'Lee', 'ph': '919876543210', 'email': 'a@x.com'})
+        self.assertEqual((candidate.first_name, error), ('Mary_Ann', None))
+
+    def test_imports_in_batches_and_reports_rejected_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            counts, rejected = self.runImport(readRows(self.csvFile(), 'sheet.csv'), batch_size=2)
+        self.assertEqual(counts, (3, 3))
+        self.assertEqual(rejected, [['4', 'Invalid phone number.'], ['6', 'A candidate with this name already exists.'],
+                                    ['7', 'A candidate with this name already exists.']])
+        self.assertEqual(sorted(Candidate.objects.values_list('first_name', flat=True)), ['Ann', 'Cid', 'Dan', 'Eve'])
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "recportal_candidate"')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual([candidate.first_name for candidate in search('java')], ['Cid'])
+
+    def test_falls_back_to_row_by_row_when_a_name_was_taken_meanwhile(self):
+        rows = [(2, {'first_name': 'Dan', 'last_name': 'Orr', 'ph': '9876543210', 'email': 'dan@x.com'}),
+                (3, {'first_name': 'Eve', 'last_name': 'Poe', 'ph': '9876543210', 'email': 'eve@x.com'})]
+        # as if Dan Orr had been created after the names were checked
+        with mock.patch.object(Candidate.objects, 'filter', return_value=Candidate.objects.none()):
+            counts, rejected = self.runImport(iter(rows))
+        self.assertEqual((counts, rejected), ((1, 1), [['2', 'A candidate with this name already exists.']]))
+        self.assertTrue(Candidate.objects.filter(first_name='Eve', last_name='Poe').exists())
+
+    def test_view_sends_back_the_rejected_rows(self):
+        self.client.force_login(User.objects.create_user('senior', password='senior', first_name='A', last_name='B'))
+        url = reverse('recportal:importcandidates')
+        sheet = ContentFile(self.csvFile().getvalue(), name='sheet.csv')
+        response = self.client.post(url, {'sheet': sheet})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(list(csv.reader(StringIO(response.content.decode())))), 4)
+        sheet = ContentFile(self.csvFile(self.ROWS[6:]).getvalue().replace(b'Eve', b'Fay'), name='sheet.csv')
+        self.assertRedirects(self.client.post(url, {'sheet': sheet}), reverse('recportal:candidates'), fetch_redirect_response=False)
+        self.assertRedirects(self.client.post(url, {'sheet': ContentFile(b'x', name='sheet.txt')}), reverse('recportal:candidates'), fetch_redirect_response=False)
+
+    def test_command_writes_the_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sheet, report = os.path.join(directory, 'sheet.xlsx'), os.path.join(directory, 'rejected.csv')
+            with open(sheet, 'wb') as f:
+                f.write(self.xlsxFile().getvalue())
+            out = StringIO()
+            call_command('importcandidates', sheet, errors=report, stdout=out)
+            with open(report) as f:
+                self.assertEqual(len(list(csv.reader(f))), 4)
+        self.assertIn('Imported 3 candidate(s), 3 row(s) rejected.', out.getvalue())
+
+
+class ExportTest(TestCase):
+    ''' the csv and xlsx exports of whole tables, see recportal/exporter.py '''
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('senior', password='senior', first_name='A', last_name='B'))
+        for name in ('Ann', 'Bob', 'Cid', 'Dan', 'Eve'):
+            Candidate.objects.create(first_name=name, last_name='Y', ph='1234567890', email='x@y.z')
+
+    def test_reads_the_table_in_chunks(self):
+        with mock.patch.object(exporter, 'CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            rows = list(exporter.exportRows('candidates', 'default'))
+        self.assertEqual([row[0] for row in rows[1:]], ['Ann', 'Bob', 'Cid', 'Dan', 'Eve'])
+        self.assertEqual(rows[0][0], 'First Name')
+        self.assertEqual(len(queries), 3)
+
+    def test_csv_is_streamed(self):
+        response = self.client.get(reverse('recportal:export', kwargs={'table': 'candidates'}))
+        self.assertTrue(response.streaming)
+        lines = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([line[0] for line in lines], ['First Name', 'Ann', 'Bob', 'Cid', 'Dan', 'Eve'])
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+        response = self.client.get(reverse('recportal:export', kwargs={'table': 'candidates'}), {'format': 'xlsx'})
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)['candidates']
+        self.assertEqual([row[0].value for row in sheet.iter_rows()], ['First Name', 'Ann', 'Bob', 'Cid', 'Dan', 'Eve'])
+
+
+class ExportRoutingTest(SimpleTestCase):
+    ''' a streamed export reads its rows after the view has returned, so it has to
+        keep to the database chosen while the request was routed '''
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_streams_from_the_database_chosen_for_the_request(self):
+        used = []
+
+        def exportRows(table, using):
+            used.append(using)
+            yield ['First Name']
+
+        with mock.patch.object(exporter, 'exportRows', exportRows):
+            useReplicas(True)       # as ReplicaMiddleware does for a GET
+            try:
+                lines = exporter.streamCSV('candidates')
+            finally:
+                useReplicas(False)
+            self.assertEqual(list(lines), ['First Name\r\n'])
+        self.assertEqual(used, ['replica'])
+
+
+class TaskStatusTest(TestCase):
+    ''' the task_status and days_late annotations and the status filters, which
+        have to agree with Task.is_overdue, is_ongoing and is_casual '''
+
+    # title: (due, completed) in days from today, and the expected (task_status, days_late)
+    TASKS = {
+        'late': ((-10, None), ('overdue', 10)),
+        'done late': ((-10, -7), ('overdue', 3)),
+        'due today': ((0, None), ('ongoing', 0)),
+        'open': ((5, None), ('ongoing', 0)),
+        'done on the day': ((-10, -10), ('completed', 0)),
+        'done early': ((-10, -12), ('completed', 0)),
+        'casual': ((None, None), ('ongoing', 0)),
+        'casual done': ((None, -5), ('completed', 0)),
+    }
+
+    def setUp(self):
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        today = datetime.date.today()
+        day = lambda offset: None if offset is None else today + datetime.timedelta(days=offset)
+        for number, (title, ((due, done), _)) in enumerate(sorted(self.TASKS.items())):
+            candidate = Candidate.objects.create(first_name='C', last_name='X' * (number + 1), ph='1234567890', email='x@y.z')
+            task = Task.objects.create(title=title, description='d', candidate=candidate, issuing_date=today - datetime.timedelta(days=20),
+                                       due_date=day(due), completion_date=day(done))
+            Assessment.objects.create(task=task, senior=self.senior, candidate=candidate)
+        candidate = Candidate.objects.create(first_name='No', last_name='Task', ph='1234567890', email='x@y.z')
+        Assessment.objects.create(senior=self.senior, candidate=candidate)
+
+    def test_annotations(self):
+        for task in Task.objects.withStatus():
+            self.assertEqual((task.task_status, task.days_late), self.TASKS[task.title][1], task.title)
+            self.assertEqual(task.task_status == 'overdue', task.is_overdue, task.title)
+        self.assertEqual(Assessment.objects.withTaskStatus().get(task=None).task_status, None)
+
+    def test_annotations_as_of_a_given_day(self):
+        task = Task.objects.withStatus(today=datetime.date.today() + datetime.timedelta(days=7)).get(title='open')
+        self.assertEqual((task.task_status, task.days_late), ('overdue', 2))
+
+    def test_filters_agree_with_the_properties(self):
+        tasks = list(Task.objects.all())
+        expected = {
+            'overdue': {task.title for task in tasks if task.is_overdue},
+            'ongoing': {task.title for task in tasks if task.is_ongoing and not task.is_overdue},
+            'completed': {task.title for task in tasks if not task.is_ongoing and not task.is_overdue},
+            'casual': {task.title for task in tasks if task.is_casual},
+        }
+        for status in TaskQuerySet.STATUSES:
+            self.assertEqual(set(Task.objects.filterStatus(status).values_list('title', flat=True)), expected[status], status)
+        with self.assertRaises(ValueError):
+            Task.objects.filterStatus('late')
+
+    def test_my_assessments_status_filter(self):
+        self.client.force_login(self.senior)
+        url = reverse('recportal:myassessments')
+        shown = lambda status: [assessment.task.title for assessment in self.client.get(url, {'status': status}).context['myassessments']]
+        self.assertEqual(shown('overdue'), ['late', 'done late'])
+        self.assertEqual(sorted(shown('casual')), ['casual', 'casual done'])
+        self.assertEqual(len(self.client.get(url, {'status': 'bogus'}).context['myassessments']), len(self.TASKS) + 1)
+
+
+class DashboardTest(TestCase):
+    ''' the recruitment funnel on the home page, see recportal/dashboard.py '''
+
+    def setUp(self):
+        cache.clear()
+        self.first, self.second = [User.objects.create_user(name, password=name, first_name=name, last_name='B') for name in ('first', 'second')]
+        ann, bob, _, _ = [Candidate.objects.create(first_name=name, last_name='Y', ph='1234567890', email='x@y.z', pitched=name == 'Dan')
+                          for name in ('Ann', 'Bob', 'Cid', 'Dan')]
+        today = datetime.date.today()
+        ongoing = Task.objects.create(title='t', description='d', candidate=ann, issuing_date=today, due_date=today + datetime.timedelta(days=5))
+        done = Task.objects.create(title='t', description='d', candidate=ann, issuing_date=today, due_date=today, completion_date=today)
+        # Ann is assessed, tasked and pitched twice, but counts once per stage
+        Assessment.objects.create(senior=self.first, candidate=ann, team='Backend', task=ongoing, pitched=True)
+        Assessment.objects.create(senior=self.second, candidate=ann, team='Frontend', task=done, pitched=True)
+        Assessment.objects.create(senior=self.first, candidate=bob, team='Backend')
+
+    def test_rollup(self):
+        funnel = dashboard.computeFunnel()
+        self.assertEqual(funnel['stages'], [('Registered', 4), ('Assessed', 2), ('Task Assigned', 1), ('Task Completed', 1),
+                                            ('Pitched by a Senior', 1), ('Pitched', 1)])
+        totals = funnel['totals']
+        self.assertEqual([totals[key] for key in ('assessments', 'pitched', 'pitch_rate', 'ongoing', 'overdue')], [3, 2, 67, 1, 0])
+        self.assertEqual(dict(funnel['statuses']), {'overdue': 0, 'ongoing': 1, 'completed': 1, 'casual': 0})
+        self.assertEqual([(row['team'], row['assessments'], row['pitched'], row['pitch_rate']) for row in funnel['teams']],
+                         [('Backend', 2, 1, 50), ('Frontend', 1, 1, 100)])
+        self.assertEqual([(row['senior_id'], row['assessments'], row['ongoing']) for row in funnel['seniors']],
+                         [(self.first.pk, 2, 1), (self.second.pk, 1, 0)])
+        self.assertEqual(dashboard.pitchRate({'pitched': 0, 'assessments': 0}), 0)
+
+    def test_stale_rollup_is_served_while_another_request_recomputes_it(self):
+        stale = dict(dashboard.computeFunnel(), computed=time.time() - settings.DASHBOARD_CACHE_TIMEOUT - 1)
+        cache.set(dashboard.CACHE_KEY, stale, None)
+        cache.add(dashboard.LOCK_KEY, True, dashboard.LOCK_TIMEOUT)
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.getFunnel()['computed'], stale['computed'])
+        cache.delete(dashboard.LOCK_KEY)
+        funnel = dashboard.getFunnel()
+        self.assertGreater(funnel['computed'], stale['computed'])
+        self.assertIsNone(cache.get(dashboard.LOCK_KEY))
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.getFunnel()['computed'], funnel['computed'])
+
+    def test_home_shows_when_it_was_computed(self):
+        self.client.force_login(self.first)
+        computed = self.client.get(reverse('recportal:home')).context['computed']
+        self.assertTrue(timezone.is_aware(computed))
+
+
+@override_settings(PAGE_SIZE=2)
+class CandidateDirectoryTest(TestCase):
+    ''' sorting, filtering and paging of the candidate directory and its JSON variant '''
+
+    CANDIDATES = [
+        # first_name, skill1, skill2, pitched
+        ('Eve', 'python', '', False),
+        ('Ann', 'java', 'Python', True),
+        ('Dan', 'go', '', False),
+        ('Bob', 'javascript', '', True),
+        ('Cid', 'rust', 'java', False),
+    ]
+
+    def setUp(self):
+        for first_name, skill1, skill2, pitched in self.CANDIDATES:
+            Candidate.objects.create(first_name=first_name, last_name='Y', ph='1234567890', email='x@y.z',
+                                     skill1=skill1, skill2=skill2, pitched=pitched, about='about ' * 100)
+        self.client.force_login(User.objects.create_user('senior', password='senior', first_name='A', last_name='B'))
+
+    def pages(self, **params):
+        ''' the first names on every page of the JSON listing '''
+        names, cursor = [], None
+        while True:
+            payload = self.client.get(reverse('recportal:candidatesjson'), dict(params, **({'after': cursor} if cursor else {}))).json()
+            names.append([candidate['first_name'] for candidate in payload['candidates']])
+            cursor = payload['next']
+            if cursor is None:
+                return names
+
+    def test_sorts(self):
+        self.assertEqual(self.pages(), [['Ann', 'Bob'], ['Cid', 'Dan'], ['Eve']])
+        self.assertEqual(sum(self.pages(sort='skill'), []), ['Dan', 'Ann', 'Bob', 'Eve', 'Cid'])
+        self.assertEqual(sum(self.pages(sort='pitched'), []), ['Cid', 'Dan', 'Eve', 'Ann', 'Bob'])
+        self.assertEqual(sum(self.pages(sort='bogus'), []), ['Ann', 'Bob', 'Cid', 'Dan', 'Eve'])
+
+    def test_filters(self):
+        # a skill matches the start of either skill, in any case
+        self.assertEqual(sum(self.pages(skill='PYTH'), []), ['Ann', 'Eve'])
+        self.assertEqual(sum(self.pages(skill='java'), []), ['Ann', 'Bob', 'Cid'])
+        self.assertEqual(sum(self.pages(skill='java', pitched='yes'), []), ['Ann', 'Bob'])
+        self.assertEqual(sum(self.pages(pitched='no', sort='skill'), []), ['Dan', 'Eve', 'Cid'])
+
+    def test_json_excerpts_the_about_text(self):
+        candidate = self.client.get(reverse('recportal:candidatesjson')).json()['candidates'][0]
+        self.assertEqual(len(candidate['about']), 140)
+
+    def test_page_keeps_the_parameters(self):
+        response = self.client.get(reverse('recportal:candidates'), {'sort': 'skill', 'skill': 'j', 'pitched': 'yes'})
+        self.assertEqual(response.context['params'], {'sort': 'skill', 'skill': 'j', 'pitched': 'yes'})
+        self.assertEqual([candidate.first_name for candidate in response.context['data']], ['Ann', 'Bob'])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class MetricsTest(TestCase):
+    ''' the per-view request metrics and their Prometheus exposition '''
+
+    def setUp(self):
+        self.user = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        self.client.force_login(self.user)
+
+    def observed(self, view):
+        histogram = metrics.registry.histograms.get(('recportal_request_duration_seconds', view))
+        return histogram.count if histogram else 0
+
+    def test_exposition(self):
+        registry = metrics.Registry()
+        registry.observe('home', [0.02, 3, 0.004, 0.01])
+        registry.countQuery('default')
+        lines = registry.exposition().splitlines()
+        self.assertIn('# TYPE recportal_request_duration_seconds histogram', lines)
+        self.assertIn('recportal_request_duration_seconds_bucket{view="home",le="0.01"} 0', lines)
+        self.assertIn('recportal_request_duration_seconds_bucket{view="home",le="0.025"} 1', lines)
+        self.assertIn('recportal_request_duration_seconds_bucket{view="home",le="+Inf"} 1', lines)
+        self.assertIn('recportal_sql_queries_bucket{view="home",le="5"} 1', lines)
+        self.assertIn('recportal_sql_queries_sum{view="home"} 3', lines)
+        self.assertIn('recportal_sql_queries_count{view="home"} 1', lines)
+        self.assertIn('recportal_sql_queries_total{alias="default"} 1', lines)
+
+    def test_views_are_recorded_with_their_queries(self):
+        before = self.observed('candidates')
+        self.client.get(reverse('recportal:candidates'))
+        self.assertEqual(self.observed('candidates'), before + 1)
+        self.assertGreater(metrics.registry.histograms[('recportal_sql_queries', 'candidates')].sum, 0)
+
+    def test_streamed_responses_are_recorded_once_sent(self):
+        before = self.observed('export')
+        response = self.client.get(reverse('recportal:export', kwargs={'table': 'candidates'}))
+        self.assertEqual(self.observed('export'), before)
+        b''.join(response.streaming_content)
+        self.assertEqual(self.observed('export'), before + 1)
+
+    def test_staff_only(self):
+        url = reverse('recportal:metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertIn(b'# TYPE recportal_request_duration_seconds histogram', response.content)
+
+
+class KeysetPaginationTest(TestCase):
+    ''' cursors come from the query string, so any value must give a page '''
+
+    def setUp(self):
+        for name in ('A', 'B', 'C'):
+            Candidate.objects.create(first_name=name, last_name='X', ph='1234567890', email='x@y.z')
+
+    def test_resumes_after_the_cursor(self):
+        rows, cursor = keysetPaginate(Candidate.objects.all(), ['first_name', 'last_name', 'pk'], None, 2)
+        self.assertEqual([row.first_name for row in rows], ['A', 'B'])
+        rows, cursor = keysetPaginate(Candidate.objects.all(), ['first_name', 'last_name', 'pk'], cursor, 2)
+        self.assertEqual(([row.first_name for row in rows], cursor), (['C'], None))
+
+    def test_invalid_cursors_give_the_first_page(self):
+        for cursor in ('not base64!', encodeCursor(['x']), encodeCursor([None]), encodeCursor([{}]), encodeCursor([1, 2])):
+            rows, _ = keysetPaginate(Candidate.objects.all(), ['pk'], cursor, 2)
+            self.assertEqual([row.first_name for row in rows], ['A', 'B'], cursor)
+        rows, _ = keysetPaginate(Assessment.objects.withTaskStatus(), ['-days_late', 'pk'], encodeCursor(['x', 1]), 2)
+        self.assertEqual(rows, [])
+
+
+class RecommendCandidateTest(TestCase):
+    ''' a candidate is recommended by a senior to another one only once '''
+
+    def setUp(self):
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        self.other = User.objects.create_user('other', password='other', first_name='C', last_name='D')
+        Senior.objects.filter(user=self.other).update(team='Backend')
+        self.candidate = Candidate.objects.create(first_name='X', last_name='Y', ph='1234567890', email='x@y.z')
+        self.client.force_login(self.senior)
+        self.url = reverse('recportal:recommend', kwargs={'first_name': 'X', 'last_name': 'Y'})
+
+    def test_individual_recommendation_once(self):
+        for _ in range(2):
+            response = self.client.post(self.url, {'mode': 'induvisual', 'senior': 'C-D', 'reason': 'good'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Recommendation.objects.filter(candidate=self.candidate, recommended_senior=self.other).count(), 1)
+
+    def test_team_recommendation_skips_recommended_seniors(self):
+        self.client.post(self.url, {'mode': 'induvisual', 'senior': 'C-D', 'reason': 'good'})
+        self.client.post(self.url, {'mode': 'team', 'team': 'Backend', 'reason': 'good'})
+        self.assertEqual(Recommendation.objects.filter(candidate=self.candidate).count(), 1)
+
+
+class RecommendationsDecisionTest(TestCase):
+    ''' accepting and declining recommendations from the inbox '''
+
+    def setUp(self):
+        cache.clear()
+        self.senior, first, second = [User.objects.create_user(name, password=name, first_name=name, last_name='B') for name in ('senior', 'first', 'second')]
+        self.ann, self.bob, self.cid = [Candidate.objects.create(first_name=name, last_name='Y', ph='1234567890', email='x@y.z') for name in ('Ann', 'Bob', 'Cid')]
+        for candidate in (self.ann, self.bob):
+            for recommending in (first, second):
+                Recommendation.objects.create(candidate=candidate, recommending_senior=recommending, recommended_senior=self.senior)
+        Recommendation.objects.create(candidate=self.cid, recommending_senior=first, recommended_senior=self.senior, status=True)
+        self.client.force_login(self.senior)
+
+    def test_applies_the_decisions_in_one_transaction(self):
+        self.assertEqual(self.senior.senior.active_recommendations_count, 2)
+        versions = [Candidate.profileCacheVersion(candidate.pk) for candidate in (self.ann, self.bob)]
+        form = {'candidate.Ann Y': 'accepted', 'candidate.Bob Y': 'declined', 'candidate.Cid Y': 'declined', 'candidate.Dan Y': 'accepted'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('recportal:recommendations'), form, follow=True)
+
+        self.assertEqual(list(Recommendation.objects.filter(candidate=self.ann).values_list('status', flat=True)), [True, True])
+        self.assertFalse(Recommendation.objects.filter(candidate=self.bob).exists())
+        self.assertTrue(Recommendation.objects.get(candidate=self.cid).status)    # accepted ones are never declined
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         ['Ann Y: accepted (2 recommendation(s)).', 'Bob Y: declined (2 recommendation(s)).',
+                          'Cid Y: no pending recommendations.', 'Dan Y: no such candidate.'])
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        begin = next(i for i, query in enumerate(sql) if query.startswith('SAVEPOINT'))
+        end = next(i for i, query in enumerate(sql) if query.startswith('RELEASE SAVEPOINT'))
+        writes = [i for i, query in enumerate(sql) if query.startswith(('UPDATE "recportal_recommendation"', 'DELETE FROM "recportal_recommendation"'))]
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(all(begin < i < end for i in writes))
+
+        self.assertEqual(Senior.objects.get(user=self.senior).active_recommendations_count, 0)
+        for candidate, version in zip((self.ann, self.bob), versions):
+            self.assertNotEqual(Candidate.profileCacheVersion(candidate.pk), version, candidate.first_name)
+
+
+class SeniorAuthTest(TestCase):
+    ''' request.senior, loaded along with the user of the session '''
+
+    def test_user_and_senior_are_loaded_in_one_query(self):
+        senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        self.client.force_login(senior)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('recportal:events'))
+        users = [query['sql'] for query in queries.captured_queries if 'FROM "auth_user"' in query['sql']]
+        seniors = [query['sql'] for query in queries.captured_queries if 'FROM "recportal_senior"' in query['sql']]
+        self.assertEqual(len(users), 1)
+        self.assertIn('JOIN "recportal_senior"', users[0])
+        self.assertEqual(seniors, [])
+
+    def test_no_senior_without_a_signed_in_user(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        SeniorMiddleware(lambda request: HttpResponse())(request)
+        self.assertFalse(request.senior)
+        self.assertEqual(request.senior, None)
+
+    def test_no_senior_without_a_profile(self):
+        user = User.objects.create_user('senior', password='senior')
+        Senior.objects.filter(user=user).delete()
+        request = RequestFactory().get('/')
+        request.user = SeniorBackend().get_user(user.pk)
+        SeniorMiddleware(lambda request: HttpResponse())(request)
+        self.assertEqual(request.senior, None)
+
+
+class ProfileCacheTest(TestCase):
+    ''' the cached pages and profile fragments follow the changes of what they show '''
+
+    def setUp(self):
+        cache.clear()
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        self.candidate = Candidate.objects.create(first_name='X', last_name='Y', ph='1234567890', email='x@y.z')
+        Assessment.objects.create(team='Backend', senior=self.senior, candidate=self.candidate)
+        self.client.force_login(self.senior)
+        self.url = reverse('recportal:profile', kwargs={'first_name': 'X', 'last_name': 'Y'})
+
+    def test_renaming_the_senior_updates_the_assessments(self):
+        self.assertContains(self.client.get(self.url), 'senior')
+        self.senior.username = 'renamed'
+        self.senior.save()
+        self.assertContains(self.client.get(self.url), 'renamed')
+        self.client.force_login(self.senior)    # saves last_login only
+        self.assertContains(self.client.get(self.url), 'renamed')
+
+    def test_renaming_the_candidate_updates_my_candidates(self):
+        Recommendation.objects.create(status=True, candidate=self.candidate, recommending_senior=self.senior, recommended_senior=self.senior)
+        self.assertContains(self.client.get(reverse('recportal:mycandidates')), 'X')
+        self.candidate.first_name = 'Renamed'
+        self.candidate.save()
+        self.assertContains(self.client.get(reverse('recportal:mycandidates')), 'Renamed')
+
+
+class RubricUploadTest(TestCase):
+    ''' assessing with a rubric sends it in chunks, see uploads.js '''
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name, RUBRIC_UPLOAD_ROOT=os.path.join(self.media_root.name, 'uploads'))
+        self.settings.enable()
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+        Candidate.objects.create(first_name='X', last_name='Y', ph='1234567890', email='x@y.z')
+        self.client.force_login(self.senior)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def test_assess_then_upload_the_rubric(self):
+        form = {'team': 'Backend', 'title': 'Task', 'description': 'Do it', 'issuing_date': '2020-01-01'}
+        response = self.client.post(reverse('recportal:assess', kwargs={'first_name': 'X', 'last_name': 'Y'}), form, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        task = response.json()['task']
+        upload = self.client.post(reverse('recportal:startupload'), {'task': task, 'filename': 'rubric.txt', 'size': 6}).json()
+        url = reverse('recportal:upload', kwargs={'upload_id': upload['id']})
+        self.assertEqual(self.client.post(url + '?offset=0', b'abc', content_type='application/octet-stream').json()['offset'], 3)
+        self.assertEqual(self.client.post(url + '?offset=0', b'abc', content_type='application/octet-stream').status_code, 409)
+        self.client.post(url + '?offset=3', b'def', content_type='application/octet-stream')
+        self.client.post(reverse('recportal:completeupload', kwargs={'upload_id': upload['id']}))
+        task = Task.objects.get(pk=task)
+        self.assertEqual((task.rubric_filename, task.rubric.read()), ('rubric.txt', b'abcdef'))
+
+    def test_malformed_upload_ids_are_not_found(self):
+        for path in ('/uploads/abc-/', '/uploads/abc-/complete/', '/uploads/00000000-0000-0000-0000-000000000000/'):
+            self.assertEqual(self.client.post(path).status_code, 404)
+
+    def test_refused_chunks_are_not_appended(self):
+        task = Task.objects.create(title='Task', description='Do it', issuing_date=datetime.date(2020, 1, 1), candidate=Candidate.objects.get())
+        upload = RubricUpload.objects.create(task=task, senior=self.senior, filename='rubric.txt', size=4)
+        with self.assertRaises(UploadError):
+            appendChunk(upload.pk, 0, BytesIO(b'abc'), sha256='0' * 64)
+        with self.assertRaises(UploadError):
+            appendChunk(upload.pk, 0, BytesIO(b'abcde'))
+        self.assertEqual(appendChunk(upload.pk, 0, BytesIO(b'abc')), 3)
+
+    def test_abandoned_uploads_expire(self):
+        task = Task.objects.create(title='Task', description='Do it', issuing_date=datetime.date(2020, 1, 1), candidate=Candidate.objects.get())
+        active, abandoned = [RubricUpload.objects.create(task=task, senior=self.senior, filename='rubric.txt', size=4) for _ in range(2)]
+        for upload in (active, abandoned):
+            appendChunk(upload.pk, 0, BytesIO(b'ab'))
+        RubricUpload.objects.update(created=timezone.now() - datetime.timedelta(days=3))
+        os.utime(stagingPath(abandoned), (time.time() - 3 * 24 * 3600,) * 2)
+        expireUploads(2 * 24 * 3600)
+        self.assertEqual(list(RubricUpload.objects.values_list('pk', flat=True)), [active.pk])
+        self.assertFalse(os.path.exists(stagingPath(abandoned)))
+
+
+class RubricStorageTest(TestCase):
+    ''' rubrics are garbage collected only once nothing can be about to reuse them '''
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        self.storage = Task._meta.get_field('rubric').storage
+        self.senior = User.objects.create_user('senior', password='senior', first_name='A', last_name='B')
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def store(self, content, age):
+        name = self.storage.save('rubric.txt', ContentFile(content))
+        os.utime(self.storage.path(name), (time.time() - age,) * 2)
+        RubricBlob.objects.update_or_create(name=name, defaults={'references': 0})
+        RubricBlob.objects.filter(name=name).update(updated_at=timezone.now() - datetime.timedelta(seconds=age))
+        return name
+
+    def test_collects_files_unreferenced_for_longer_than_the_grace(self):
+        old, recent = self.store(b'old', 7200), self.store(b'recent', 60)
+        reused = self.store(b'reused', 7200)
+        self.storage.save('again.txt', ContentFile(b'reused'))     # an upload about to reference it
+        call_command('gcrubrics', stdout=StringIO())
+        self.assertEqual([self.storage.exists(name) for name in (old, recent, reused)], [False, True, True])
+        self.assertEqual(set(RubricBlob.objects.values_list('name', flat=True)), {recent, reused})
+
+    def test_download_names_cannot_break_the_header(self):
+        name = self.store(b'rubric', 0)
+        self.client.force_login(self.senior)
+        response = self.client.get(reverse('recportal:download', kwargs={'filename': name}), {'name': 'evil\r\nSet-Cookie: x=1.txt'})
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="evilSet-Cookie: x=1.txt"')
+
+
+class ApiTest(TestCase):
+    ''' conditional requests and the "changes since" queries of the JSON API '''
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('senior', password='senior', first_name='A', last_name='B'))
+        self.url = reverse('recportal:api', kwargs={'resource': 'candidates'})
+        self.candidates = [Candidate.objects.create(first_name=name, last_name='Y', ph='1234567890', email='x@y.z') for name in ('Ann', 'Bob', 'Cid')]
+
+    def age(self, seconds):
+        Candidate.objects.update(updated_at=timezone.now() - datetime.timedelta(seconds=seconds))
+
+    def test_unchanged_listing_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Candidate.objects.create(first_name='Dan', last_name='Y', ph='1234567890', email='x@y.z')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        self.candidates[0].delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_since_returns_the_changes_and_deletions(self):
+        self.age(3600)
+        since = (timezone.now() - datetime.timedelta(seconds=600)).isoformat()
+        ann, bob, cid = self.candidates
+        deleted = cid.pk
+        bob.save()
+        cid.delete()
+        payload = self.client.get(self.url, {'since': since}).json()
+        self.assertEqual([row['id'] for row in payload['results']], [bob.pk])
+        self.assertEqual(payload['deleted'], [deleted])
+        self.assertEqual(self.client.get(self.url, {'since': payload['until']}).json()['deleted'], [deleted])
+
+    @override_settings(API_SINCE_SAFETY_SECONDS=60)
+    def test_since_overlaps_the_safety_window(self):
+        self.age(3600)
+        since = timezone.now() - datetime.timedelta(seconds=600)
+        Candidate.objects.filter(pk=self.candidates[0].pk).update(updated_at=since - datetime.timedelta(seconds=30))
+        results = self.client.get(self.url, {'since': since.isoformat()}).json()['results']
+        self.assertEqual([row['id'] for row in results], [self.candidates[0].pk])
+
+    def test_invalid_since_is_refused(self):
+        for since in ('yesterday', '2026-13-45T00:00:00'):
+            response = self.client.get(self.url, {'since': since})
+            self.assertEqual((response.status_code, response.json()), (400, {'error_message': 'since must be an ISO 8601 timestamp.'}))
+
+    @override_settings(API_SINCE_MAX_AGE=3600)
+    def test_since_older_than_the_deletions_kept_is_refused(self):
+        since = (timezone.now() - datetime.timedelta(seconds=7200)).isoformat()
+        self.assertEqual(self.client.get(self.url, {'since': since}).status_code, 400)
+
+    @override_settings(API_SINCE_MAX_AGE=3600)
+    def test_old_deletions_are_pruned(self):
+        old, recent = [candidate.pk for candidate in self.candidates[:2]]
+        Candidate.objects.filter(pk__in=[old, recent]).delete()
+        Deletion.objects.filter(object_id=old).update(deleted_at=timezone.now() - datetime.timedelta(seconds=7200))
+        call_command('prunedeletions', stdout=StringIO())
+        self.assertEqual(list(Deletion.objects.values_list('object_id', flat=True)), [recent])
+
+    def test_batched_deletions_are_one_insert(self):
+        with CaptureQueriesContext(connection) as queries, batchDeletions():
+            Candidate.objects.all().delete()
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "recportal_deletion"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Deletion.objects.count(), 3)
+
+
+class StaticFilesTest(SimpleTestCase):
+    ''' the static files served when no front web server serves STATIC_ROOT '''
+
+    def setUp(self):
+        self.static_root = tempfile.TemporaryDirectory()
+        files = {
+            'app.js': b'plain',
+            'app.0123456789ab.js': b'hashed',
+            'app.0123456789ab.js.gz': b'gzipped',
+            'staticfiles.json': json.dumps({'paths': {'app.js': 'app.0123456789ab.js'}, 'version': '1.0'}).encode(),
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.static_root.name, name), 'wb') as f:
+                f.write(content)
+        self.settings = override_settings(STATIC_ROOT=self.static_root.name)
+        self.settings.enable()
+        hashedNames.cache_clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        hashedNames.cache_clear()
+        self.static_root.cleanup()
+
+    def test_hashed_names_are_immutable(self):
+        response = self.client.get('/static/app.0123456789ab.js')
+        self.assertEqual(b''.join(response.streaming_content), b'hashed')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.client.get('/static/app.js')['Cache-Control'], 'no-cache')
+
+    def test_gzip_is_served_when_accepted(self):
+        response = self.client.get('/static/app.0123456789ab.js', HTTP_ACCEPT_ENCODING='br;q=1.0, gzip;q=0.8')
+        self.assertEqual((response['Content-Encoding'], b''.join(response.streaming_content)), ('gzip', b'gzipped'))
+        for header in ('identity', 'gzip;q=0', 'br, gzip; q=0.0'):
+            response = self.client.get('/static/app.0123456789ab.js', HTTP_ACCEPT_ENCODING=header)
+            self.assertFalse(response.has_header('Content-Encoding'), header)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_unhashed_names_are_revalidated(self):
+        last_modified = self.client.get('/static/app.js')['Last-Modified']
+        self.assertEqual(self.client.get('/static/app.js', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get('/static/app.0123456789ab.js', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_head_sends_the_headers_only(self):
+        response = self.client.head('/static/app.0123456789ab.js')
+        self.assertFalse(response.streaming)
+        self.assertEqual((response.content, response['Content-Length']), (b'', '6'))
+
+
+class DownloadTest(TestCase):
+    ''' rubric downloads: conditional requests, byte ranges and the sendfile modes '''
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        with open(os.path.join(self.media_root.name, 'rubric.txt'), 'wb') as f:
+            f.write(b'0123456789')
+        self.client.force_login(User.objects.create_user('senior', password='senior', first_name='A', last_name='B'))
+        self.url = reverse('recportal:download', kwargs={'filename': 'rubric.txt'})
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def test_parse_range(self):
+        self.assertEqual(parseRange('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parseRange('bytes=7-', 10), (7, 9))
+        self.assertEqual(parseRange('bytes=-3', 10), (7, 9))
+        self.assertEqual(parseRange('bytes=5-100', 10), (5, 9))
+        for header in (None, '', 'bytes=-', 'bytes=0-1,4-5', 'lines=1-2', 'bytes=a-b'):
+            self.assertIsNone(parseRange(header, 10), header)
+        for header in ('bytes=10-', 'bytes=5-2', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parseRange(header, 10)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+        self.assertEqual((response['Content-Length'], response['Accept-Ranges']), ('10', 'bytes'))
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (206, b'2345'))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 2-5/10', '4'))
+        # a malformed range gets the whole file, an unsatisfiable one a 416
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=x-y').status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag).status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_sendfile_modes(self):
+        with override_settings(RUBRIC_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual((response.content, response['X-Sendfile']), (b'', os.path.join(os.path.abspath(self.media_root.name), 'rubric.txt')))
+        with override_settings(RUBRIC_SENDFILE='x-accel-redirect', RUBRIC_ACCEL_PREFIX='/protected/'):
+            self.assertEqual(self.client.get(self.url)['X-Accel-Redirect'], '/protected/rubric.txt')
+
+    def test_paths_outside_the_media_root_are_not_found(self):
+        self.assertEqual(self.client.get(reverse('recportal:download', kwargs={'filename': '../secret.txt'})).status_code, 404)
+        self.assertEqual(self.client.get(reverse('recportal:download', kwargs={'filename': 'missing.txt'})).status_code, 404)
+
+
+class SearchTest(TestCase):
+    ''' the ranking of recportal/search.py '''
+
+    def setUp(self):
+        Candidate.objects.create(first_name='Ann', last_name='Lee', ph='1234567890', email='x@y.z', skill1='java', skill2='javascript')
+        Candidate.objects.create(first_name='Bob', last_name='Kim', ph='1234567890', email='x@y.z', skill1='python', skill2='javafx')
+        Candidate.objects.create(first_name='Cid', last_name='Roe', ph='1234567890', email='x@y.z', skill1='c', about='java java java java')
+
+    def names(self, query):
+        return [candidate.first_name for candidate in search(query)]
+
+    def test_names_outrank_skills_and_skills_the_about_text(self):
+        Candidate.objects.create(first_name='Eve', last_name='Python', ph='1234567890', email='x@y.z')
+        self.assertEqual(self.names('python'), ['Eve', 'Bob'])
+        # the about text of Cid repeats java, which only counts up to MAX_ABOUT_WEIGHT times
+        self.assertEqual(self.names('java'), ['Ann', 'Bob', 'Cid'])
+
+    def test_the_last_word_is_a_prefix(self):
+        self.assertEqual(self.names('jav'), ['Ann', 'Bob', 'Cid'])
+        self.assertEqual(self.names('pyth'), ['Bob'])
+
+    def test_candidates_matching_more_words_come_first(self):
+        # Ann matches jav twice (java and javascript), which is still one word
+        self.assertEqual(self.names('python jav'), ['Bob', 'Ann', 'Cid'])
+
+    def test_short_last_words_match_whole_terms(self):
+        self.assertEqual(self.names('c'), ['Cid'])
+        self.assertEqual(self.names('j'), [])
+
+
+@tag('benchmark')
+class SearchBenchmark(TestCase):
+    ''' A search costs the matching postings, not the candidates: a selective query
+        stays within a few milliseconds from 10^3 to 10^5 indexed candidates. '''
+
+    SIZES = [10 ** 3, 10 ** 5]
+    # a name, and a name and a prefix matching 1% of the candidates
+    QUERIES = ['last{}', 'last{} pyth']
+    MAX_MS = 20
+
+    def seed(self, upto):
+        start = Candidate.objects.count()
+        last = Candidate.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        Candidate.objects.bulk_create(
+            [Candidate(first_name='first_{}'.format(letters(i)), last_name='last{}'.format(letters(i)), ph='9999999999', email='c{}@example.com'.format(i),
+                       skill1='python' if i % 100 == 0 else 'skill{}'.format(letters(i % 500)), about='about {}'.format(letters(i))) for i in range(start, upto)]
+        )
+        indexCandidates(Candidate.objects.filter(pk__gt=last))
+
+    def timeSearches(self, size):
+        timings = []
+        for i in range(0, size, size // 50):
+            for query in self.QUERIES:
+                start = time.perf_counter()
+                self.assertTrue(search(query.format(letters(i))))
+                timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    def test_search_cost_is_flat(self):
+        medians = {}
+        for size in self.SIZES:
+            self.seed(size)
+            self.timeSearches(size)     # warm up
+            medians[size] = self.timeSearches(size)
+        self.assertLess(medians[self.SIZES[-1]], self.MAX_MS, medians)
+        self.assertLess(medians[self.SIZES[-1]], medians[self.SIZES[0]] * 5 + 1, medians)
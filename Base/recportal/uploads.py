@@ -0,0 +1,130 @@
+import os
+import time
+import hashlib
+import datetime
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from recportal.models import Task, RubricUpload
+
+COPY_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    ''' a chunk or a completion request that cannot be accepted, the message is
+        meant for the client '''
+    pass
+
+
+class StagedFile(File):
+    ''' A finished staging file. Exposing temporary_file_path() makes the rubric
+        storage move the file into MEDIA_ROOT instead of copying it. '''
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def stagingPath(upload):
+    return os.path.join(settings.RUBRIC_UPLOAD_ROOT, '{}.part'.format(upload.pk))
+
+
+def uploadOffset(upload):
+    ''' the number of bytes received so far, i.e. where the client has to resume '''
+    try:
+        return os.path.getsize(stagingPath(upload))
+    except OSError:
+        return 0
+
+
+def appendChunk(upload_id, offset, stream, sha256=None):
+    ''' Append the chunk read from stream (e.g. the request) to the staging file
+        of the upload. offset must be the current size of the staging file, so
+        retried or duplicated chunks are refused instead of corrupting the file.
+        If sha256 is given, the chunk is only appended if it matches. Returns
+        the new offset.
+
+        The chunk is read (at the pace of the client) and checked before the row
+        of the upload is locked, so the lock and the database connection are only
+        held while the file is appended to. '''
+    chunk = stream.read(settings.RUBRIC_UPLOAD_CHUNK_SIZE + 1)
+    if len(chunk) > settings.RUBRIC_UPLOAD_CHUNK_SIZE:
+        raise UploadError('Chunks may be at most {} bytes.'.format(settings.RUBRIC_UPLOAD_CHUNK_SIZE))
+    if sha256 and hashlib.sha256(chunk).hexdigest() != sha256.lower():
+        raise UploadError('Chunk checksum mismatch.')
+
+    with transaction.atomic():
+        # the row lock serialises concurrent chunks of the same upload
+        upload = RubricUpload.objects.select_for_update().get(pk=upload_id)
+        current = uploadOffset(upload)
+        if offset != current:
+            raise UploadError('Expected offset {}.'.format(current))
+        if current + len(chunk) > upload.size:
+            raise UploadError('More data than the declared size.')
+
+        os.makedirs(settings.RUBRIC_UPLOAD_ROOT, exist_ok=True)
+        with open(stagingPath(upload), 'ab') as f:
+            f.write(chunk)
+        return current + len(chunk)
+
+
+def expireUploads(max_age, dry_run=False):
+    ''' Delete the uploads (rows and staging files) that received nothing for
+        max_age seconds, and the staging files left without an upload. Returns
+        the names of the staging files deleted. '''
+    cutoff = time.time() - max_age
+    deleted = []
+    for upload in RubricUpload.objects.filter(created__lt=timezone.now() - datetime.timedelta(seconds=max_age)):
+        path = stagingPath(upload)
+        with transaction.atomic():
+            # the row lock waits for a chunk being appended right now
+            if not RubricUpload.objects.select_for_update().filter(pk=upload.pk).exists():
+                continue
+            if os.path.exists(path) and os.path.getmtime(path) > cutoff:
+                continue    # still being uploaded
+            if not dry_run:
+                if os.path.exists(path):
+                    os.remove(path)
+                upload.delete()
+        deleted.append(os.path.basename(path))
+
+    if os.path.isdir(settings.RUBRIC_UPLOAD_ROOT):
+        uploads = set('{}.part'.format(pk) for pk in RubricUpload.objects.values_list('pk', flat=True))
+        for filename in os.listdir(settings.RUBRIC_UPLOAD_ROOT):
+            path = os.path.join(settings.RUBRIC_UPLOAD_ROOT, filename)
+            if filename in uploads or filename in deleted or os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            deleted.append(filename)
+    return deleted
+
+
+def completeUpload(upload_id):
+    ''' Verify the staging file (size and, if one was declared, the checksum of the
+        whole file) and attach it to the task as its rubric. The task row is locked
+        and the file is moved into place, so the rubric changes in one step. '''
+    with transaction.atomic():
+        upload = RubricUpload.objects.select_for_update().get(pk=upload_id)
+        path = stagingPath(upload)
+        if uploadOffset(upload) != upload.size:
+            raise UploadError('Upload incomplete, {} of {} bytes received.'.format(uploadOffset(upload), upload.size))
+        if upload.sha256:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_SIZE), b''):
+                    digest.update(block)
+            if digest.hexdigest() != upload.sha256.lower():
+                os.remove(path)
+                raise UploadError('Checksum mismatch, the upload has to be restarted.')
+
+        task = Task.objects.select_for_update().get(pk=upload.task_id)
+        task.rubric_filename = upload.filename
+        with open(path, 'rb') as f:
+            task.rubric.save(upload.filename, StagedFile(f, name=upload.filename), save=True)
+        if os.path.exists(path):    # the storage already had this file
+            os.remove(path)
+        upload.delete()
+        return task
@@ -2,6 +2,8 @@ from django.conf.urls import url
 from recportal import views
 
 app_name = 'recportal'
+# a RubricUpload id, anything else would not even be looked up
+UPLOAD_ID = r'(?P<upload_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'
 urlpatterns = [
     url(r'^signin/$', views.SignIn, name='signin'),
     url(r'^signout/$', views.SignOut, name='signout'),
@@ -9,11 +11,21 @@ urlpatterns = [
     url(r'^recommendations/$', views.Recommendations, name='recommendations'),
     url(r'^my-candidates/$', views.MyCandidates, name='mycandidates'),
     url(r'^candidates/$', views.Candidates, name='candidates'),
+    url(r'^candidates/json/$', views.CandidatesJSON, name='candidatesjson'),
+    url(r'^candidates/import/$', views.ImportCandidates, name='importcandidates'),
+    url(r'^search/$', views.Search, name='search'),
+    url(r'^events/$', views.Events, name='events'),
     url(r'^profile/(?P<first_name>[A-Za-z_]+)-(?P<last_name>[A-Za-z]+)/$', views.CandidateProfile, name='profile'),
     url(r'^assess/(?P<first_name>[A-Za-z_]+)-(?P<last_name>[A-Za-z]+)/$', views.AssessCandidate, name='assess'),
     url(r'^recommend/(?P<first_name>[A-Za-z_]+)-(?P<last_name>[A-Za-z]+)/$', views.RecommendCandidate, name='recommend'),
     url(r'^my-assessments/$', views.MyAssessments, name="myassessments"),
     url(r'^assessments/$', views.Assessments, name="assessments"),
+    url(r'^uploads/$', views.StartRubricUpload, name="startupload"),
+    url(r'^uploads/' + UPLOAD_ID + r'/$', views.RubricUploadChunk, name="upload"),
+    url(r'^uploads/' + UPLOAD_ID + r'/complete/$', views.CompleteRubricUpload, name="completeupload"),
     url(r'^download/(?P<filename>.+)/$', views.Download, name="download"),
+    url(r'^export/(?P<table>candidates|assessments|recommendations)/$', views.Export, name="export"),
+    url(r'^metrics/$', views.Metrics, name='metrics'),
+    url(r'^api/v1/(?P<resource>candidates|assessments|recommendations)/$', views.Api, name='api'),
     url(r'^edit/(?P<first_name>[A-Za-z_]+)-(?P<last_name>[A-Za-z]+)/$', views.EditCandidate, name='edit')
 ]
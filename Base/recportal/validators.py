@@ -0,0 +1,13 @@
+import re
+
+# a phone number is either 10 digits or 10 digits prefixed with the country code 91
+PHONE_RE = re.compile(r'^(91)?[0-9]{10}$')
+EMAIL_RE = re.compile(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)")
+
+
+def isValidPhone(ph):
+    return bool(PHONE_RE.match(ph))
+
+
+def isValidEmail(email):
+    return bool(EMAIL_RE.match(email))
@@ -1,17 +1,53 @@
 import os
-import re
+import csv
+import tempfile
 from datetime import datetime
 
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, FileResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.shortcuts import render, redirect, get_object_or_404
-
-from recportal.mimeTypes import MIME_TYPES
+from django.urls import reverse
+from django.views.decorators.http import condition
+
+from recportal import api
+from recportal.dashboard import getFunnel
+from recportal.downloads import serveRubric, rubricETag, rubricLastModified
+from recportal.events import pendingEvents, notifyRecommendations
+from recportal.exporter import streamCSV, writeXLSX
+from recportal.importer import SheetError, readRows, importCandidates
+from recportal import metrics
 from recportal.models import *
+from recportal.pagination import keysetPaginate
+from recportal.search import search
+from recportal.signals import batchDeletions
+from recportal.staticfiles import imageVariants, serveStatic
+from recportal.uploads import UploadError, uploadOffset, appendChunk, completeUpload
+from recportal.validators import isValidPhone, isValidEmail
+
+
+def candidatePage(request):
+    ''' one page of the candidate directory as described by the GET parameters
+        sort (see CandidateQuerySet.SORT_KEYS), skill, pitched and the cursor "after".
+        Returns a tuple of (candidates, next_cursor, params). '''
+    params = {
+        'sort': request.GET.get('sort', 'name'),
+        'skill': request.GET.get('skill', ''),
+        'pitched': request.GET.get('pitched', ''),
+    }
+    if params['sort'] not in CandidateQuerySet.SORT_KEYS:
+        params['sort'] = 'name'
+    candidates = Candidate.objects.listing().filterBy(skill=params['skill'], pitched=params['pitched'])
+    rows, next_cursor = keysetPaginate(candidates, CandidateQuerySet.SORT_KEYS[params['sort']], request.GET.get('after'), settings.PAGE_SIZE)
+    return rows, next_cursor, params
 
 
 @login_required
@@ -20,7 +56,7 @@ def Candidates(request):
 
     if request.method == 'GET':
         context = {}
-        context['data'] = Candidate.objects.all()
+        context['data'], context['next_cursor'], context['params'] = candidatePage(request)
         return render(request, 'recportal/candidates.html', context)
 
     if request.method == 'POST':
@@ -32,13 +68,12 @@ def Candidates(request):
             last_name = data['last_name'].replace(' ', '_')
 
             ph = data["ph"]
-            if not re.match(r'(^[0-9]{10}$)', ph):
-                if not re.match(r'^91([0-9]{10})$', ph):
-                	messages.add_message(request, messages.ERROR, 'Invalid phone number.')
-                	return redirect('recportal:candidates')
+            if not isValidPhone(ph):
+                messages.add_message(request, messages.ERROR, 'Invalid phone number.')
+                return redirect('recportal:candidates')
 
             email = data["email"]
-            if not re.match(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)",email):
+            if not isValidEmail(email):
                 messages.add_message(request, messages.ERROR, 'Invalid email address.')
                 return redirect('recportal:candidates')
 
@@ -59,7 +94,12 @@ def Candidates(request):
             messages.add_message(request, messages.ERROR, 'Essential data missing.')
             return redirect('recportal:candidates')
 
-        Candidate.objects.create(first_name=first_name, last_name=last_name, ph=ph, email=email, skill1=skill1, skill2=skill2, about=about ,pitched=False)
+        try:
+            with transaction.atomic():
+                Candidate.objects.create(first_name=first_name, last_name=last_name, ph=ph, email=email, skill1=skill1, skill2=skill2, about=about ,pitched=False)
+        except IntegrityError:
+            messages.add_message(request, messages.ERROR, 'A candidate with this name already exists.')
+            return redirect('recportal:candidates')
         messages.add_message(request, messages.INFO, 'Candidate successfully created!')
         return redirect('recportal:candidates')
 
@@ -67,6 +107,127 @@ def Candidates(request):
         return JsonResponse({'error_message':'Invalid request method.'})
 
 
+@login_required
+def ImportCandidates(request):
+    ''' bulk import candidates from an uploaded .csv or .xlsx sheet (see recportal/importer.py).
+        If any rows were rejected, the report of them is sent back as a csv file. '''
+
+    if request.method == 'POST':
+        if "sheet" not in request.FILES:
+            messages.add_message(request, messages.ERROR, 'No sheet uploaded.')
+            return redirect('recportal:candidates')
+        sheet = request.FILES["sheet"]
+        report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode='w+', newline='')
+        try:
+            imported, rejected = importCandidates(readRows(sheet, sheet.name), csv.writer(report))
+        except SheetError as err:
+            messages.add_message(request, messages.ERROR, str(err))
+            return redirect('recportal:candidates')
+
+        messages.add_message(request, messages.INFO, 'Imported {} candidate(s), {} row(s) rejected.'.format(imported, rejected))
+        if not rejected:
+            return redirect('recportal:candidates')
+        report.seek(0)
+        response = HttpResponse(report.read(), content_type='text/csv')
+        response["Content-Disposition"] = "attachment; filename=rejected-rows.csv"
+        return response
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def CandidatesJSON(request):
+    ''' the candidate directory as JSON so that the front-end can page through
+        it incrementally. Takes the same GET parameters as the candidates page
+        and returns the cursor of the next page as "next" (null on the last page). '''
+
+    if request.method == 'GET':
+        rows, next_cursor, params = candidatePage(request)
+        payload = []
+        for candidate in rows:
+            payload.append({
+                'id': candidate.pk,
+                'first_name': candidate.first_name,
+                'last_name': candidate.last_name,
+                'ph': candidate.ph,
+                'email': candidate.email,
+                'skill1': candidate.skill1,
+                'skill2': candidate.skill2,
+                'about': candidate.about_excerpt,
+                'pitched': candidate.pitched,
+            })
+        return JsonResponse({'candidates': payload, 'next': next_cursor})
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def Api(request, resource):
+    ''' Version 1 of the JSON API, see recportal/api.py for the GET parameters.
+        Clients should revalidate with If-None-Match or If-Modified-Since, which
+        is answered with a 304 when nothing changed. '''
+
+    if request.method == 'GET':
+        try:
+            page = api.Page(resource, request.GET)
+        except api.ApiError as e:
+            return JsonResponse({'error_message': str(e)}, status=400)
+        etag = quote_etag(page.etag)
+        response = get_conditional_response(request, etag=etag, last_modified=page.last_modified)
+        if response is None:
+            response = JsonResponse(page.payload())
+        response['ETag'] = etag
+        if page.last_modified:
+            response['Last-Modified'] = http_date(page.last_modified)
+        # cached, but always revalidated
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def Events(request):
+    ''' the live notifications of the user as server-sent events, see recportal/events.py '''
+
+    if request.method == 'GET':
+        last_event_id = request.META.get('HTTP_LAST_EVENT_ID', '')
+        last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+        response = HttpResponse(pendingEvents(request.senior, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def Search(request):
+    ''' ranked search over the names, skills and about texts of the candidates
+        (see recportal/search.py), as JSON '''
+
+    if request.method == 'GET':
+        results = []
+        for candidate in search(request.GET.get('q', '')):
+            results.append({
+                'id': candidate.pk,
+                'first_name': candidate.first_name,
+                'last_name': candidate.last_name,
+                'skill1': candidate.skill1,
+                'skill2': candidate.skill2,
+                'about': candidate.about_excerpt,
+                'score': candidate.score,
+                'url': reverse('recportal:profile', args=[candidate.first_name, candidate.last_name]),
+            })
+        return JsonResponse({'results': results})
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
 @login_required
 def CandidateProfile(request, first_name, last_name):
     ''' the induvisual profile page for each candidate '''
@@ -74,29 +235,44 @@ def CandidateProfile(request, first_name, last_name):
     if request.method == 'GET':
         context = {}
         context['candidate'] = get_object_or_404(Candidate, first_name=first_name, last_name=last_name)
+        # only evaluated if the cached fragment is missing, see profile.html
+        context['assessments'] = context['candidate'].assessments.select_related('task', 'senior')
+        context['profile_version'] = Candidate.profileCacheVersion(context['candidate'].pk)
+        context['profile_timeout'] = settings.PROFILE_CACHE_TIMEOUT
         return render(request, 'recportal/profile.html', context)
 
     else:
         return JsonResponse({'error_message':'Invalid request method.'})
 
 @login_required
+@condition(etag_func=rubricETag, last_modified_func=rubricLastModified)
 def Download(request, filename):
-    try:
-        filetype = filename.split(".")[-1]
-    except IndexError: # default to text
-        filetype = "txt"
-    try:
-        mimetype = MIME_TYPES[filetype]
-    except KeyError:
-        filetype = "txt"
-        mimetype = "text/plain"
-    with open(os.path.join(settings.MEDIA_ROOT, filename), "rb") as f:
-        response = HttpResponse(f.read(), content_type=mimetype)
-        response["Content-Disposition"] = "inline; filename=" + filename
-    return response
+    ''' stream a rubric. Repeat views are answered with a 304 through the ETag
+        and Last-Modified validators and byte ranges are supported, see
+        recportal/downloads.py '''
+    return serveRubric(request, filename)
 
 
 
+@login_required
+def Export(request, table):
+    ''' export a whole table for committee meetings, see recportal/exporter.py.
+        CSV (the default) is streamed row by row as it is read from the database,
+        ?format=xlsx builds the workbook in write-only mode first. '''
+
+    if request.method == 'GET':
+        if request.GET.get('format') == 'xlsx':
+            response = FileResponse(writeXLSX(table), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            response["Content-Disposition"] = "attachment; filename={}.xlsx".format(table)
+        else:
+            response = StreamingHttpResponse(streamCSV(table), content_type='text/csv')
+            response["Content-Disposition"] = "attachment; filename={}.csv".format(table)
+        return response
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
 @login_required
 def EditCandidate(request, first_name, last_name):
 
@@ -109,15 +285,14 @@ def EditCandidate(request, first_name, last_name):
             candidate.last_name = data['last_name'].replace(' ', '_')
 
             ph = data["ph"]
-            if not re.match(r'(^[0-9]{10}$)', ph):
-                if not re.match(r'^91([0-9]{10})$', ph):
-                    messages.add_message(request, messages.ERROR, 'Invalid phone number.', extra_tags="edit")
-                    return redirect('recportal:profile', first_name, last_name)
+            if not isValidPhone(ph):
+                messages.add_message(request, messages.ERROR, 'Invalid phone number.', extra_tags="edit")
+                return redirect('recportal:profile', first_name, last_name)
             else:
                 candidate.ph = ph
 
             email = data["email"]
-            if not re.match(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)",email):
+            if not isValidEmail(email):
                 messages.add_message(request, messages.ERROR, 'Invalid email address.', extra_tags="edit")
                 return redirect('recportal:profile', first_name, last_name)
             else:
@@ -140,7 +315,12 @@ def EditCandidate(request, first_name, last_name):
             messages.add_message(request, messages.ERROR, 'Essential data missing.', extra_tags="edit")
             return redirect('recportal:profile', candidate.first_name, candidate.last_name)
 
-        candidate.save()
+        try:
+            with transaction.atomic():
+                candidate.save()
+        except IntegrityError:
+            messages.add_message(request, messages.ERROR, 'A candidate with this name already exists.', extra_tags="edit")
+            return redirect('recportal:profile', first_name, last_name)
         messages.add_message(request, messages.INFO, 'Candidate successfully edited!', extra_tags="edit")
         return redirect('recportal:profile', candidate.first_name, candidate.last_name)
 
@@ -149,10 +329,14 @@ def EditCandidate(request, first_name, last_name):
 
 @login_required
 def Home(request):
-    ''' the first page you go to after logging in '''
+    ''' the first page you go to after logging in, with the recruitment funnel
+        (see recportal/dashboard.py) '''
 
     if request.method == 'GET':
-        return render(request, 'recportal/home.html')
+        context = {}
+        context['funnel'] = getFunnel()
+        context['computed'] = datetime.datetime.fromtimestamp(context['funnel']['computed'], timezone.utc)
+        return render(request, 'recportal/home.html', context)
 
     else:
         return JsonResponse({'error_message':'Invalid request method.'})
@@ -164,7 +348,7 @@ def MyCandidates(request):
 
     if request.method == 'GET':
         context = {}
-        context['data'] = request.user.senior.getCandidates()
+        context['data'], context['next_cursor'] = request.senior.getCandidatesPage(request.GET.get('after'))
         return render(request, 'recportal/mycandidates.html', context)
 
     else:
@@ -176,7 +360,11 @@ def MyAssessments(request):
 
     if request.method == 'GET':
         context = {}
-        context['myassessments'] = request.user.assessments.all()
+        status = request.GET.get('status', '')
+        # overdue tasks first, the most late at the top
+        context['myassessments'] = request.user.assessments.withRelations().withTaskStatus().filterBy(status=status).order_by('-days_late', 'pk')
+        context['status'] = status
+        context['statuses'] = TaskQuerySet.STATUSES
         return render(request, 'recportal/myassessments.html', context)
 
     if request.method == 'POST':
@@ -199,6 +387,72 @@ def MyAssessments(request):
         return JsonResponse({'error_message':'Invalid request method.'})
 
 
+@login_required
+def StartRubricUpload(request):
+    ''' Start a chunked, resumable rubric upload (see recportal/uploads.py) for a
+        task of one of your assessments. POST task, filename, size and optionally
+        sha256 (of the whole file). Returns the id of the upload, the offset to
+        send the first chunk at and the maximum chunk size. '''
+
+    if request.method == 'POST':
+        data = request.POST
+        try:
+            task = Task.objects.get(pk=int(data['task']), assessment__senior=request.user)
+            filename = os.path.basename(data['filename'])
+            size = int(data['size'])
+        except (KeyError, ValueError, Task.DoesNotExist):
+            return JsonResponse({'error_message': 'Invalid upload.'}, status=400)
+        if not filename or size <= 0:
+            return JsonResponse({'error_message': 'Invalid upload.'}, status=400)
+        upload = RubricUpload.objects.create(task=task, senior=request.user, filename=filename[:100], size=size, sha256=data.get('sha256', '')[:64])
+        return JsonResponse({'id': str(upload.pk), 'offset': 0, 'chunk_size': settings.RUBRIC_UPLOAD_CHUNK_SIZE})
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def RubricUploadChunk(request, upload_id):
+    ''' GET the offset to resume an upload from, or POST the next chunk as the raw
+        request body with the offset it starts at in the "offset" GET parameter and
+        optionally its sha256 in the X-Chunk-SHA256 header. The body is read straight
+        into the staging file, it is never parsed as a form. '''
+
+    upload = get_object_or_404(RubricUpload, pk=upload_id, senior=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse({'offset': uploadOffset(upload), 'size': upload.size, 'chunk_size': settings.RUBRIC_UPLOAD_CHUNK_SIZE})
+
+    if request.method == 'POST':
+        try:
+            offset = appendChunk(upload.pk, int(request.GET.get('offset', -1)), request, request.META.get('HTTP_X_CHUNK_SHA256'))
+        except ValueError:
+            return JsonResponse({'error_message': 'Invalid offset.'}, status=400)
+        except UploadError as err:
+            return JsonResponse({'error_message': str(err), 'offset': uploadOffset(upload)}, status=409)
+        return JsonResponse({'offset': offset, 'size': upload.size})
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+@login_required
+def CompleteRubricUpload(request, upload_id):
+    ''' verify a fully uploaded rubric and attach it to its task '''
+
+    upload = get_object_or_404(RubricUpload, pk=upload_id, senior=request.user)
+
+    if request.method == 'POST':
+        try:
+            task = completeUpload(upload.pk)
+        except UploadError as err:
+            return JsonResponse({'error_message': str(err), 'offset': uploadOffset(upload)}, status=409)
+        return JsonResponse({'rubric': task.rubric.name})
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
 @login_required
 def AssessCandidate(request, first_name, last_name):
     ''' the view for the form to assess candidates '''
@@ -209,19 +463,12 @@ def AssessCandidate(request, first_name, last_name):
         return render(request, 'recportal/assess.html', context)
 
     if request.method == 'POST':
-        # don't forget to make a verification script
         data = request.POST
         files = request.FILES
-        # first, don't let the same senior assess the same candidate more than once
-        try:
-            candidate= get_object_or_404(Candidate, first_name=first_name, last_name=last_name)
-            p = Assessment.objects.get(candidate=candidate, senior=request.user)
-            if p:
-                messages.add_message(request, messages.ERROR, 'You have already assessed this candidate', extra_tags="assessment")
-            return redirect('recportal:profile', first_name=first_name, last_name=last_name)
-        except:
-            pass
-        # then, make sure that all of the data is valid and create the new assessment
+        # whether the senior already has a recommendation of the candidate comes along with it
+        recommendations = Recommendation.objects.filter(candidate=OuterRef('pk'), recommended_senior=request.user)
+        candidate = get_object_or_404(Candidate.objects.annotate(recommended=Exists(recommendations)), first_name=first_name, last_name=last_name)
+        # make sure that all of the data is valid before writing anything
         possible_teams = ['App Dev', 'Backend', 'Frontend', 'Graphics', 'Video']
         try:
             team = data['team']
@@ -232,46 +479,84 @@ def AssessCandidate(request, first_name, last_name):
             desc = data['description']
 
             isd = datetime.datetime.strptime(data['issuing_date'], '%Y-%m-%d').date()
+            try:
+                dd = datetime.datetime.strptime(data['due_date'], '%Y-%m-%d').date()
+            except:
+                dd = None   # a casual task
 
             if "rubric" in files.keys():
+                # only sent in one piece by browsers without javascript, see assess.html
                 rubric = files["rubric"]
                 # no extra security measures are taken to check the type of the file uploaded
                 # since this webapp is closed only to member of a department, there is no need for it.
             else:
                 rubric = None
 
-            try:
-                dd = datetime.datetime.strptime(data['due_date'], '%Y-%m-%d').date()
-                task = Task.objects.create(title=title, description=desc, issuing_date=isd, due_date=dd, candidate=candidate, rubric=rubric)
-            except:
-                task = Task.objects.create(title=title, description=desc, issuing_date=isd, candidate=candidate, rubric=rubric)
-            assessment = Assessment.objects.create(team=team, task=task, senior=request.user ,candidate=candidate)
-            if assessment:
-                messages.add_message(request, messages.INFO, 'Assessment added successfully!', extra_tags="assessment")
-
-            # one last thing to do is to self recommend the candidate so that s/he is in 'MyCandidates'
-            # if they previously accepted a recommendation, just ignore it, otherwise make one
-            try:
-                Recommendation.objects.get(candidate=candidate, recommended_senior=request.user)
-            except:
-                Recommendation.objects.create(status=True, reason='Assessed by self', candidate=candidate, recommending_senior=request.user, recommended_senior=request.user )
+        except Exception as err:
+            return HttpResponse('missing credentials. {}'.format(err), status=400)
 
-            # finally, redirect them to the profile page along with the message
+        # then create the task, the assessment and, unless they previously had a recommendation
+        # of the candidate, a self recommendation so that s/he is in 'MyCandidates', all or none.
+        # The same senior can't assess the same candidate more than once, which the unique
+        # (senior, candidate) constraint enforces even for concurrent submissions.
+        try:
+            with transaction.atomic():
+                task = Task.objects.create(title=title, description=desc, issuing_date=isd, due_date=dd, candidate=candidate, rubric=rubric)
+                Assessment.objects.create(team=team, task=task, senior=request.user, candidate=candidate)
+                if not candidate.recommended:
+                    Recommendation.objects.create(status=True, reason='Assessed by self', candidate=candidate, recommending_senior=request.user, recommended_senior=request.user)
+        except IntegrityError:
+            # only a violation of that constraint means they already assessed the
+            # candidate, anything else (e.g. the candidate deleted meanwhile) is an error
+            if not Assessment.objects.filter(senior=request.user, candidate=candidate).exists():
+                raise
+            messages.add_message(request, messages.ERROR, 'You have already assessed this candidate', extra_tags="assessment")
             return redirect('recportal:profile', first_name=first_name, last_name=last_name)
+        messages.add_message(request, messages.INFO, 'Assessment added successfully!', extra_tags="assessment")
 
-        except Exception as err:
-            return HttpResponse('missing credentials. {}'.format(err))
+        if request.is_ajax():
+            # the form's script then sends the rubric in chunks (see uploads.js) and goes to the profile
+            return JsonResponse({'task': task.pk})
+
+        # finally, redirect them to the profile page along with the message
+        return redirect('recportal:profile', first_name=first_name, last_name=last_name)
 
     else:
         return JsonResponse({'error_message':'Invalid request method.'})
 
+# the orderings of the assessments page, ending with the primary key for keyset pagination
+ASSESSMENT_SORT_KEYS = {
+    'created': ['pk'],
+    'lateness': ['-days_late', 'pk'],
+}
+
 @login_required
 def Assessments(request):
-    ''' A simple view to render the assessments page where all created assessments are visible '''
+    ''' A simple view to render the assessments page where all created assessments are visible.
+        The assessments are filtered by the team, senior, pitched and (task) status GET
+        parameters, sorted by the sort GET parameter (see ASSESSMENT_SORT_KEYS) and
+        paginated with a cursor (the "after" GET parameter). '''
 
     if request.method == 'GET':
         context = {}
-        context['assessments'] = Assessment.objects.all()
+        filters = {
+            'team': request.GET.get('team', ''),
+            'senior': request.GET.get('senior', ''),
+            'pitched': request.GET.get('pitched', ''),
+            'status': request.GET.get('status', ''),
+        }
+        if not filters['senior'].isdigit():
+            filters['senior'] = ''
+        sort = request.GET.get('sort', '')
+        if sort not in ASSESSMENT_SORT_KEYS:
+            sort = 'created'
+        assessments = Assessment.objects.withRelations().withTaskStatus().filterBy(**filters)
+        context['assessments'], context['next_cursor'] = keysetPaginate(assessments, ASSESSMENT_SORT_KEYS[sort], request.GET.get('after'), settings.PAGE_SIZE)
+        context['filters'] = filters
+        context['sort'] = sort
+        context['statuses'] = TaskQuerySet.STATUSES
+        context['teams'] = ['App Dev', 'Backend', 'Frontend', 'Graphics', 'Video']
+        context['all_seniors'] = User.objects.order_by('first_name', 'last_name')
         return render(request, 'recportal/assessments.html', context)
 
     else:
@@ -300,11 +585,27 @@ def RecommendCandidate(request, first_name, last_name):
             except:
                 messages.add_message(request, messages.ERROR, 'Senior does not exist. Stay away from dev tools.', extra_tags="recommend")
                 return redirect('recportal:profile', first_name=first_name, last_name=last_name)
-            rec = Recommendation.objects.create(reason=reason, recommending_senior=request.user, recommended_senior=senior, candidate=candidate)
+            try:
+                with transaction.atomic():
+                    rec = Recommendation.objects.create(reason=reason, recommending_senior=request.user, recommended_senior=senior, candidate=candidate)
+            except IntegrityError:
+                messages.add_message(request, messages.ERROR, 'You have already recommended this candidate to {}.'.format(senior.get_full_name()), extra_tags="recommend")
+                return redirect('recportal:profile', first_name=first_name, last_name=last_name)
         elif mode == "team":
-            for senior in Senior.objects.filter(team=data["team"]):
-                if senior != request.user.senior:
-                    Recommendation.objects.create(reason=reason, recommending_senior=request.user, recommended_senior=senior.user, candidate=candidate)
+            # one query for the seniors of the team who don't already have a pending or accepted
+            # recommendation for this candidate, and one batch insert for all of them. A concurrent
+            # recommendation of the candidate to one of them fails the unique key and the whole batch.
+            try:
+                with transaction.atomic():
+                    seniors = list(Senior.objects.filter(team=data["team"]).exclude(user=request.user).exclude(user__recommended__candidate=candidate).values_list('user_id', flat=True))
+                    Recommendation.objects.bulk_create([Recommendation(reason=reason, recommending_senior=request.user, recommended_senior_id=senior, candidate=candidate) for senior in seniors])
+            except IntegrityError:
+                messages.add_message(request, messages.ERROR, 'The candidate was recommended to the team at the same time, please try again.', extra_tags="recommend")
+                return redirect('recportal:profile', first_name=first_name, last_name=last_name)
+            # bulk_create does not send post_save, so the badge counts are dropped
+            # and the seniors notified here
+            Senior.invalidateRecommendationCaches(seniors)
+            notifyRecommendations(seniors, candidate, request.user)
             rec = True
         if rec:
             messages.add_message(request, messages.INFO, 'Recommended successfully!', extra_tags="recommend")
@@ -322,39 +623,82 @@ def Recommendations(request):
 
     if request.method == 'GET':
         context = {}
-        context['data'] = request.user.senior.getActiveRecommendations()
+        context['data'], context['next_cursor'] = request.senior.getActiveRecommendations(request.GET.get('after'))
         return render(request, 'recportal/recommendations.html', context)
 
     if request.method == 'POST':
+        # collect the decision for every candidate in the form first, ...
+        decisions = {}
         for key in request.POST:
-            if key.split('.')[0] == 'candidate':
-                name = key.split('.')[1]
-                first_name = name.split(' ')[0]
-                last_name = name.split(' ')[1]
-                try:
-                    candidate = Candidate.objects.get(first_name=first_name, last_name=last_name)
-                    recommendations = Recommendation.objects.filter(candidate=candidate, recommended_senior=request.user)
-
-                    if request.POST[key] == 'accepted':
-                        for recommendation in recommendations:
-                            recommendation.status = True
-                            recommendation.save()
-                    elif request.POST[key] == 'declined':
-                        for recommendation in recommendations:
-                            recommendation.delete()
-                    else: # neutral
-                        pass
-
-                except Exception as error:
-                    pass
+            if key.split('.')[0] == 'candidate' and request.POST[key] in ('accepted', 'declined'):
+                name = tuple(key.split('.', 1)[1].split(' '))
+                if len(name) == 2:
+                    decisions[name] = request.POST[key]
+                else:
+                    messages.add_message(request, messages.ERROR, '{}: not a valid candidate.'.format(key.split('.', 1)[1]))
+        if not decisions:
+            return redirect('recportal:recommendations')
+
+        # ... then resolve all of the names in one query ...
+        names = Q()
+        for first_name, last_name in decisions:
+            names |= Q(first_name=first_name, last_name=last_name)
+        candidates = {(first_name, last_name): pk for pk, first_name, last_name in Candidate.objects.filter(names).values_list('pk', 'first_name', 'last_name')}
+        accepted = [candidates[name] for name, decision in decisions.items() if decision == 'accepted' and name in candidates]
+        declined = [candidates[name] for name, decision in decisions.items() if decision == 'declined' and name in candidates]
+
+        # ... and apply them as one UPDATE and one DELETE. Only pending recommendations
+        # are touched, accepted ones (e.g. 'Assessed by self') are kept.
+        pending = Recommendation.objects.filter(recommended_senior=request.user, status=False)
+        with transaction.atomic(), batchDeletions():
+            counts = dict(pending.filter(candidate_id__in=accepted + declined).values_list('candidate').annotate(Count('pk')))
+            pending.filter(candidate_id__in=accepted).update(status=True, updated_at=timezone.now())
+            pending.filter(candidate_id__in=declined).delete()
+        Senior.invalidateRecommendationCaches([request.user.pk])
+        # update() sends no signals, the declined ones were dropped by post_delete
+        for candidate_id in accepted:
+            Candidate.invalidateProfileCache(candidate_id)
+        notifyRecommendations([request.user.pk])     # for their other tabs
+
+        for (first_name, last_name), decision in sorted(decisions.items()):
+            name = '{} {}'.format(first_name, last_name)
+            if (first_name, last_name) not in candidates:
+                messages.add_message(request, messages.ERROR, '{}: no such candidate.'.format(name))
+            elif not counts.get(candidates[(first_name, last_name)]):
+                messages.add_message(request, messages.ERROR, '{}: no pending recommendations.'.format(name))
+            else:
+                messages.add_message(request, messages.INFO, '{}: {} ({} recommendation(s)).'.format(name, decision, counts[candidates[(first_name, last_name)]]))
 
         return redirect('recportal:recommendations')
 
 
+@user_passes_test(lambda user: user.is_staff)
+def Metrics(request):
+    ''' the per-view request metrics in the Prometheus text format, for staff only '''
+
+    if request.method == 'GET':
+        return HttpResponse(metrics.registry.exposition(), content_type='text/plain; version=0.0.4')
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
+def Static(request, path):
+    ''' the collected static files, for when no front web server serves STATIC_ROOT
+        (see recportal/staticfiles.py) '''
+
+    if request.method in ('GET', 'HEAD'):
+        return serveStatic(request, path)
+
+    else:
+        return JsonResponse({'error_message':'Invalid request method.'})
+
+
 def SignIn(request):
     if request.method == 'GET':
         ''' Render the signin page '''
         context = {}
+        context['background'] = imageVariants('recportal/Background.jpg')
         return render(request, 'recportal/signin.html', context)
 
     if request.method == 'POST':